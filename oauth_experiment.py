@@ -11,13 +11,17 @@ This script mimics rclone's OAuth flow:
 """
 
 import http.server
-import socketserver
 import urllib.parse
-import webbrowser
-import requests
 import json
-from threading import Thread
+import random
 import time
+from threading import Event, Thread
+
+try:
+    import orjson
+except ImportError:
+    # Optional: orjson decodes JSON responses several times faster than stdlib json
+    orjson = None
 
 # Microsoft OAuth endpoints
 AUTH_URL = "https://login.microsoftonline.com/common/oauth2/v2.0/authorize"
@@ -39,9 +43,29 @@ SCOPES = [
     "offline_access"
 ]
 
+# Token requests answered with these statuses are retried, with backoff
+TOKEN_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+TOKEN_EXCHANGE_ATTEMPTS = 4
+
+# Space-separated scope string sent with both the authorization and the token request
+SCOPE_STR = ' '.join(SCOPES)
+
+# Everything in the authorization URL is a module constant, so it is built once at import
+_AUTH_PARAMS = {
+    'client_id': CLIENT_ID,
+    'response_type': 'code',
+    'redirect_uri': REDIRECT_URI,
+    'scope': SCOPE_STR,
+    'response_mode': 'query',
+    'prompt': 'select_account'
+}
+_AUTH_URL_FULL = f"{AUTH_URL}?{urllib.parse.urlencode(_AUTH_PARAMS)}"
+
 # Global to store the authorization code
 auth_code = None
-server_running = True
+
+# Set once the OAuth callback has been handled
+done = Event()
 
 class OAuthCallbackHandler(http.server.BaseHTTPRequestHandler):
     """Handle OAuth callback from Microsoft."""
@@ -51,7 +75,7 @@ class OAuthCallbackHandler(http.server.BaseHTTPRequestHandler):
         pass
     
     def do_GET(self):
-        global auth_code, server_running
+        global auth_code
         
         # Parse query parameters
         parsed_path = urllib.parse.urlparse(self.path)
@@ -77,10 +101,11 @@ class OAuthCallbackHandler(http.server.BaseHTTPRequestHandler):
             """
             self.wfile.write(success_html.encode())
             
-            # Signal to stop the server
-            server_running = False
             print("\n✅ Authorization code received!")
             
+            # Signal to stop the server and wake up main()
+            done.set()
+            
         elif 'error' in params:
             error = params['error'][0]
             error_desc = params.get('error_description', ['Unknown error'])[0]
@@ -102,40 +127,41 @@ class OAuthCallbackHandler(http.server.BaseHTTPRequestHandler):
             """
             self.wfile.write(error_html.encode())
             
-            server_running = False
             print(f"\n❌ Authentication error: {error}")
             print(f"   Description: {error_desc}")
+            done.set()
 
 
 def start_local_server():
-    """Start local HTTP server to receive OAuth callback."""
+    """
+    Start the local HTTP server that receives the OAuth callback.
+    
+    The socket is bound before this returns, so the browser can be launched right
+    away; requests are served on a background thread until main() calls shutdown().
+    """
     PORT = 53682
     
-    with socketserver.TCPServer(("", PORT), OAuthCallbackHandler) as httpd:
-        print(f"🌐 Local server started on http://localhost:{PORT}")
-        print("   Waiting for OAuth callback...")
-        
-        # Keep server running until we get the callback
-        while server_running:
-            httpd.handle_request()
-            time.sleep(0.1)
-        
-        print("🛑 Server stopped")
+    # HTTPServer sets SO_REUSEADDR, so a quick rerun can rebind the port while the
+    # previous run's socket is still in TIME_WAIT (plain TCPServer fails for ~60 s)
+    httpd = http.server.ThreadingHTTPServer(("", PORT), OAuthCallbackHandler)
+    print(f"🌐 Local server started on http://localhost:{PORT}")
+    print("   Waiting for OAuth callback...")
+    
+    # Requests are handled as they arrive; main() is woken by `done`, not by this loop
+    Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
 
 
 def build_auth_url():
-    """Build OAuth authorization URL."""
-    params = {
-        'client_id': CLIENT_ID,
-        'response_type': 'code',
-        'redirect_uri': REDIRECT_URI,
-        'scope': ' '.join(SCOPES),
-        'response_mode': 'query',
-        'prompt': 'select_account'
-    }
-    
-    url = f"{AUTH_URL}?{urllib.parse.urlencode(params)}"
-    return url
+    """Return the OAuth authorization URL (precomputed at import)."""
+    return _AUTH_URL_FULL
+
+
+def parse_json(resp: 'requests.Response'):
+    """Decode a JSON response body, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(resp.content)
+    return resp.json()
 
 
 def exchange_code_for_token(code):
@@ -148,14 +174,30 @@ def exchange_code_for_token(code):
         'client_id': CLIENT_ID,
         'client_secret': CLIENT_SECRET,
         'redirect_uri': REDIRECT_URI,
-        'scope': ' '.join(SCOPES)
+        'scope': SCOPE_STR
     }
     
+    # Imported here so the import cost is paid while the user is signing in, not at startup
+    import requests
+    
     try:
-        response = requests.post(TOKEN_URL, data=data, timeout=30)
+        # Retry throttling and transient server errors, so a hiccup does not send the
+        # user back through the browser sign-in
+        for attempt in range(TOKEN_EXCHANGE_ATTEMPTS):
+            response = requests.post(TOKEN_URL, data=data, timeout=30)
+            if response.status_code not in TOKEN_RETRY_STATUSES or attempt == TOKEN_EXCHANGE_ATTEMPTS - 1:
+                break
+            
+            try:
+                delay = float(response.headers.get('Retry-After', ''))
+            except ValueError:
+                delay = min(2 ** attempt, 8)
+            delay += random.random()
+            print(f"⏳ Token endpoint returned {response.status_code}, retrying in {delay:.1f}s...")
+            time.sleep(delay)
         
         if response.status_code == 200:
-            token_data = response.json()
+            token_data = parse_json(response)
             return token_data
         else:
             print(f"❌ Token exchange failed: {response.status_code}")
@@ -190,12 +232,8 @@ def main():
     print(f"   {auth_url[:100]}...")
     print()
     
-    # Start local server in a separate thread
-    server_thread = Thread(target=start_local_server, daemon=True)
-    server_thread.start()
-    
-    # Wait a moment for server to start
-    time.sleep(1)
+    # Start local server; it serves on a separate thread
+    httpd = start_local_server()
     
     # Launch browser
     print("🌐 Launching browser for authentication...")
@@ -203,6 +241,7 @@ def main():
     print()
     
     try:
+        import webbrowser
         webbrowser.open(auth_url)
     except Exception as e:
         print(f"❌ Could not launch browser: {e}")
@@ -212,14 +251,18 @@ def main():
     # Wait for authorization code
     print("⏳ Waiting for authorization (timeout: 120 seconds)...")
     
+    # done.wait() returns as soon as the callback arrives; the 10 s slices only pace progress messages
     timeout = 120
     elapsed = 0
-    while auth_code is None and elapsed < timeout:
-        time.sleep(1)
-        elapsed += 1
-        
-        if elapsed % 10 == 0:
-            print(f"   Still waiting... ({elapsed}/{timeout}s)")
+    while not done.wait(timeout=10):
+        elapsed += 10
+        if elapsed >= timeout:
+            break
+        print(f"   Still waiting... ({elapsed}/{timeout}s)")
+    
+    httpd.shutdown()
+    httpd.server_close()
+    print("🛑 Server stopped")
     
     if auth_code is None:
         print("\n❌ Timeout waiting for authorization")
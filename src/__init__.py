@@ -8,6 +8,7 @@ Modules:
 - acl_manager: Comprehensive ACL management (list, invite, remove permissions)
 - acl_scanner: Scan OneDrive for folders with ACL permissions
 - config_utils: Shared configuration utilities
+- graph_utils: Shared Microsoft Graph request utilities
 - debug_permissions: Debug tools for permission analysis
 """
 
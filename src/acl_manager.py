@@ -33,14 +33,50 @@ Examples:
     python -m src.acl_manager bulk-remove-user marianascbastos@hotmail.com --target-dir "Work"
 """
 
-import requests
-import json
 import sys
+
+try:
+    import requests
+except ImportError:
+    sys.exit("❌ requests library not found\nPlease install it: pip install requests")
+
+import io
+import json
 import argparse
 import os
-from typing import Dict, List, Optional
-from .config_utils import get_access_token
-from .acl_scanner import scan_shared_folders_recursive, filter_folders_by_user
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from .config_utils import get_access_token, load_json_cache, save_json_cache
+from .graph_utils import (
+    GRAPH_BASE_URL, ITEM_FIELDS, REQUEST_TIMEOUT, SESSION, auth_headers, dump_json,
+    graph_batch, item_path_endpoint, iter_response_items, parse_json_response, permissions_list_url, permissions_url,
+    prewarm_session
+)
+
+ROLE_SEPARATOR = ', '
+
+# Email -> permission ID per item, recorded by 'list' and used by 'remove'
+PERMISSION_ID_CACHE = "perm_ids.json"
+_PERMISSION_ID_CACHE_LOCK = threading.Lock()
+
+# Only a 429 proves an invite was not processed; a 503 may follow a sent invite,
+# so it is reported rather than re-sent
+INVITE_RETRY_STATUSES = frozenset({429})
+
+# Seconds a resolved item ID or fetched permissions list is reused within one process
+ITEM_CACHE_TTL = 60.0
+
+# (access token, item path) -> (fetched at, item ID, lookup message)
+_ITEM_ID_CACHE: Dict[Tuple[str, str], Tuple[float, str, str]] = {}
+
+# Item ID -> (fetched at, permissions); dropped whenever the item's ACL is changed
+_PERMISSIONS_CACHE: Dict[str, Tuple[float, List[Dict]]] = {}
+
+# Items processed at once by multi-item commands (OneDrive throttles beyond a few concurrent calls per user)
+MAX_ITEM_WORKERS = 5
 
 
 def _handle_api_error(status_code: int, response_text: str, operation: str) -> None:
@@ -70,44 +106,114 @@ def _handle_api_error(status_code: int, response_text: str, operation: str) -> N
 
 
 
-def process_multiple_items(item_paths: List[str], access_token: str, processor_func, operation_name: str) -> Dict:
+def _normalize_item_paths(item_paths: List[str]) -> List[str]:
+    """
+    Clean up user-supplied item paths before any Graph call is made.
+    
+    Surrounding whitespace and slashes are stripped and duplicates dropped
+    (keeping the first occurrence). Empty paths and paths Graph would reject
+    ('..' segments, control characters, a trailing ':') are reported and skipped.
+    """
+    seen = set()
+    normalized = []
+    for raw_path in item_paths:
+        item_path = raw_path.strip().strip('/')
+        if not item_path:
+            print(f"⚠️  Skipping empty path: {raw_path!r}")
+        elif '..' in item_path.split('/') or item_path.endswith(':') \
+                or any(ord(char) < 32 or char == '\x7f' for char in item_path):
+            print(f"⚠️  Skipping invalid path: {raw_path!r}")
+        elif item_path in seen:
+            print(f"ℹ️  Skipping duplicate path: {item_path}")
+        else:
+            seen.add(item_path)
+            normalized.append(item_path)
+    return normalized
+
+
+class _ThreadOutput(io.TextIOBase):
+    """Stand-in for sys.stdout that sends each worker thread's output to its own buffer."""
+    
+    def __init__(self, target):
+        self._target = target
+        self._local = threading.local()
+    
+    def write(self, text: str) -> int:
+        buffer = getattr(self._local, 'buffer', None)
+        return (buffer if buffer is not None else self._target).write(text)
+    
+    def flush(self) -> None:
+        self._target.flush()
+    
+    def capture(self, func, *args):
+        """Run func in the calling thread and return (result, captured output)."""
+        self._local.buffer = io.StringIO()
+        try:
+            return func(*args), self._local.buffer.getvalue()
+        finally:
+            self._local.buffer = None
+
+
+def _process_item(item_path: str, access_token: str, processor_func, by_id: bool = False) -> bool:
+    """Resolve one item (unless it is already an ID) and run the processor on it. Returns True on success."""
+    # Get item ID
+    item_id = item_path if by_id else get_item_id(item_path, access_token)
+    if not item_id:
+        print(f"❌ Skipping item {item_path} - could not get item ID")
+        return False
+    
+    # Process the item
+    try:
+        return bool(processor_func(item_id, item_path, access_token))
+    except Exception as e:
+        print(f"❌ Error processing {item_path}: {e}")
+        return False
+
+
+def process_multiple_items(item_paths: List[str], access_token: str, processor_func, operation_name: str,
+                           by_id: bool = False) -> Dict:
     """
     Generic function to process multiple OneDrive items with a given processor function.
     
+    Items are processed concurrently, up to MAX_ITEM_WORKERS at a time. Each
+    item's output is buffered and printed as one block, in the order given.
+    
     Args:
         item_paths: List of paths to process
         access_token: OAuth access token
         processor_func: Function that processes a single item (item_id, item_path, access_token) -> bool
         operation_name: Name of the operation for logging (e.g., "ACL listing", "metadata retrieval")
+        by_id: Treat item_paths as drive item IDs and skip the path lookups
     
     Returns:
         Dict with success/failure counts and summary
     """
     successful_items = 0
     failed_items = 0
+    if not by_id:
+        item_paths = _normalize_item_paths(item_paths)
     
-    for i, item_path in enumerate(item_paths, 1):
+    def run(i: int, item_path: str) -> bool:
         print(f"\n{'='*80}")
         print(f"Processing item {i}/{len(item_paths)}: {item_path}")
         print(f"{'='*80}")
-        
-        # Get item ID
-        item_id = get_item_id(item_path, access_token)
-        if not item_id:
-            print(f"❌ Skipping item {item_path} - could not get item ID")
-            failed_items += 1
-            continue
-        
-        # Process the item
-        try:
-            success = processor_func(item_id, item_path, access_token)
-            if success:
-                successful_items += 1
-            else:
-                failed_items += 1
-        except Exception as e:
-            print(f"❌ Error processing {item_path}: {e}")
-            failed_items += 1
+        return _process_item(item_path, access_token, processor_func, by_id)
+    
+    if len(item_paths) <= 1:
+        results = [run(i, item_path) for i, item_path in enumerate(item_paths, 1)]
+    else:
+        output = _ThreadOutput(sys.stdout)
+        results = []
+        with redirect_stdout(output), ThreadPoolExecutor(max_workers=min(MAX_ITEM_WORKERS, len(item_paths))) as executor:
+            futures = [executor.submit(output.capture, run, i, item_path)
+                       for i, item_path in enumerate(item_paths, 1)]
+            for future in futures:
+                success, report = future.result()
+                sys.stdout.write(report)
+                results.append(success)
+    
+    successful_items = sum(results)
+    failed_items = len(results) - successful_items
     
     # Print summary
     print(f"\n{'='*80}")
@@ -128,172 +234,167 @@ def process_multiple_items(item_paths: List[str], access_token: str, processor_f
     }
 
 
-def print_permission_details(perm: Dict) -> None:
-    """Print detailed information about a single permission."""
-    print(f"  ID: {perm.get('id', 'N/A')}")
-    print(f"  Roles: {', '.join(perm.get('roles', []))}")
+def _format_user_lines(user: Dict) -> str:
+    """Format the user/email lines shared by grantedTo and grantedToIdentities."""
+    user_get = user.get
+    return (f"  User: {user_get('displayName', 'N/A')} ({user_get('id', 'N/A')})\n"
+            f"  Email: {user_get('email', 'N/A')}\n")
+
+
+def format_permission_details(perm: Dict) -> str:
+    """
+    Format detailed information about a single permission as printable lines.
+    
+    The lines are f-strings rather than str.format_map templates: f-strings are
+    compiled to bytecode once with the function, while format_map re-parses its
+    template and needs a defaults mapping built on every call.
+    """
+    # Bind each field once; on large ACLs this runs for every entry
+    get = perm.get
+    granted_to = get('grantedTo')
+    granted_to_identities = get('grantedToIdentities') or ()
+    link = get('link')
+    expiration = get('expirationDateTime')
+    
+    parts = [f"  ID: {get('id', 'N/A')}\n  Roles: {ROLE_SEPARATOR.join(get('roles') or ())}\n"]
     
     # Check for grantedTo (OneDrive Personal)
-    granted_to = perm.get('grantedTo')
     if granted_to and granted_to.get('user'):
-        user = granted_to['user']
-        print(f"  User: {user.get('displayName', 'N/A')} ({user.get('id', 'N/A')})")
-        print(f"  Email: {user.get('email', 'N/A')}")
+        parts.append(_format_user_lines(granted_to['user']))
     
     # Check for grantedToIdentities (OneDrive Business)
-    granted_to_identities = perm.get('grantedToIdentities', [])
-    if granted_to_identities:
-        for identity in granted_to_identities:
-            if identity.get('user'):
-                user = identity['user']
-                print(f"  User: {user.get('displayName', 'N/A')} ({user.get('id', 'N/A')})")
-                print(f"  Email: {user.get('email', 'N/A')}")
+    for identity in granted_to_identities:
+        user = identity.get('user')
+        if user:
+            parts.append(_format_user_lines(user))
     
     # Check for link information
-    link = perm.get('link')
     if link:
-        print(f"  Link Type: {link.get('type', 'N/A')}")
-        print(f"  Link Scope: {link.get('scope', 'N/A')}")
-        print(f"  Link URL: {link.get('webUrl', 'N/A')}")
+        link_get = link.get
+        parts.append(f"  Link Type: {link_get('type', 'N/A')}\n"
+                     f"  Link Scope: {link_get('scope', 'N/A')}\n"
+                     f"  Link URL: {link_get('webUrl', 'N/A')}\n")
     
     # Additional permission details
-    if perm.get('hasPassword'):
-        print(f"  Password Protected: Yes")
+    if get('hasPassword'):
+        parts.append("  Password Protected: Yes\n")
     
-    if perm.get('expirationDateTime'):
-        print(f"  Expires: {perm.get('expirationDateTime')}")
+    if expiration:
+        parts.append(f"  Expires: {expiration}\n")
+    
+    return "".join(parts)
+
 
+def print_permission_details(perm: Dict) -> None:
+    """Print detailed information about a single permission with a single write."""
+    sys.stdout.write(format_permission_details(perm))
+
+
+def _permission_emails(perm: Dict) -> Iterator[str]:
+    """Yield the casefolded emails a permission is granted to."""
+    # Check grantedToIdentities (OneDrive Business)
+    for identity in perm.get('grantedToIdentities') or ():
+        user = identity.get('user')
+        if user and user.get('email'):
+            yield user['email'].casefold()
+    
+    # Check grantedTo (OneDrive Personal)
+    granted_to = perm.get('grantedTo')
+    if granted_to:
+        user = granted_to.get('user')
+        if user and user.get('email'):
+            yield user['email'].casefold()
 
-def find_user_permission_id(permissions: List[Dict], email: str) -> Optional[str]:
-    """Find the permission ID for a specific user email."""
+
+def index_permissions_by_email(permissions: Iterable[Dict]) -> Dict[str, str]:
+    """
+    Map each (casefolded) email to its permission ID in a single pass.
+    
+    Use this to look up several emails against one listing; the first
+    permission granted to an email wins, as with find_user_permission_id.
+    """
+    email_ids = {}
     for perm in permissions:
-        # Check grantedToIdentities (OneDrive Business)
-        granted_to_identities = perm.get('grantedToIdentities', [])
-        for identity in granted_to_identities:
-            if identity.get('user') and identity['user'].get('email') == email:
-                return perm.get('id')
-        
-        # Check grantedTo (OneDrive Personal)  
-        granted_to = perm.get('grantedTo')
-        if granted_to and granted_to.get('user') and granted_to['user'].get('email') == email:
+        _index_permission(email_ids, perm)
+    return email_ids
+
+
+def _index_permission(email_ids: Dict[str, str], perm: Dict) -> None:
+    """Add one permission's emails to an email -> permission ID map, keeping earlier entries."""
+    perm_id = perm.get('id')
+    if perm_id:
+        for email in _permission_emails(perm):
+            email_ids.setdefault(email, perm_id)
+
+
+def find_user_permission_id(permissions: Iterable[Dict], email: str) -> Optional[str]:
+    """
+    Find the permission ID for a specific user email, stopping at the first match.
+    
+    Emails are compared case-insensitively, as mailbox names are in practice.
+    """
+    target = email.casefold()
+    for perm in permissions:
+        if target in _permission_emails(perm):
             return perm.get('id')
     
     return None
 
 
-def get_item_permissions(item_id: str, access_token: str) -> Optional[List[Dict]]:
-    """Get permissions for an item. Returns None on error."""
-    headers = {"Authorization": f"Bearer {access_token}"}
-    permissions_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{item_id}/permissions"
+def _invalidate_item_permissions(item_id: str) -> None:
+    """Forget the cached permissions of an item after its ACL was changed."""
+    _PERMISSIONS_CACHE.pop(item_id, None)
+
+
+def _cache_permissions(item_id: str, permissions: Iterator[Dict]) -> Iterator[Dict]:
+    """Pass permissions through, caching the list once it has been read to the end."""
+    collected = []
+    for perm in permissions:
+        collected.append(perm)
+        yield perm
+    _PERMISSIONS_CACHE[item_id] = (time.monotonic(), collected)
+
+
+def get_item_permissions(item_id: str, access_token: str, cache: bool = True) -> Optional[Iterator[Dict]]:
+    """
+    Get permissions for an item. Returns None on error.
+    
+    The status is checked up front; the permissions themselves are parsed, and
+    further pages fetched, lazily as the returned iterator is consumed
+    (see iter_response_items). A list read to the end within the last
+    ITEM_CACHE_TTL seconds is served from memory instead; pass cache=False
+    for callers that are about to change the ACL, so the list is always read
+    from Graph and not retained.
+    """
+    if cache:
+        cached = _PERMISSIONS_CACHE.get(item_id)
+        if cached and time.monotonic() - cached[0] < ITEM_CACHE_TTL:
+            return iter(cached[1])
+    
+    headers = auth_headers(access_token)
     
     try:
-        resp = requests.get(permissions_url, headers=headers, timeout=30)
+        resp = SESSION.get(permissions_list_url(item_id), headers=headers, timeout=REQUEST_TIMEOUT, stream=True)
         if resp.status_code == 200:
-            permissions_data = resp.json()
-            return permissions_data.get("value", [])
+            permissions = iter_response_items(resp, headers, stream=True)
+            return _cache_permissions(item_id, permissions) if cache else permissions
         else:
             print(f"❌ Failed to get permissions: {resp.status_code}")
             if resp.status_code == 403:
                 print("This could be due to insufficient permissions or API access issues")
+            resp.close()
             return None
     except requests.exceptions.RequestException as e:
         print(f"❌ Network error: {e}")
         return None
 
 
-def _process_single_acl_listing(item_id: str, item_path: str, access_token: str) -> bool:
-    """Process ACL listing for a single item. Returns True on success."""
-    # Get permissions for this item
-    headers = {"Authorization": f"Bearer {access_token}"}
-    permissions_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{item_id}/permissions"
-    print(f"\nGetting ACL from: {permissions_url}")
-    
-    try:
-        resp = requests.get(permissions_url, headers=headers, timeout=30)
-        print(f"Response Status: {resp.status_code}")
-        
-        if resp.status_code == 200:
-            permissions_data = resp.json()
-            permissions = permissions_data.get("value", [])
-            
-            if permissions:
-                print(f"\n✅ Found {len(permissions)} permission(s) in ACL:")
-                print("=" * 60)
-                
-                for i, perm in enumerate(permissions, 1):
-                    print(f"\nPermission {i}:")
-                    print_permission_details(perm)
-                    print("-" * 40)
-            else:
-                print("ℹ️  No permissions found for this item (empty ACL)")
-            return True
-        else:
-            _handle_api_error(resp.status_code, resp.text, "get ACL")
-            return False
-            
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Network error: {e}")
-        return False
-    except Exception as e:
-        print(f"❌ Unexpected error: {e}")
-        return False
-
-
-def _process_single_permission_removal(email: str):
-    """Return a closure that processes permission removal for a single item."""
-    def processor(item_id: str, item_path: str, access_token: str) -> bool:
-        # Get permissions for this item
-        permissions = get_item_permissions(item_id, access_token)
-        if permissions is None:
-            return False
-        
-        # Find permission for the specified email
-        target_permission_id = find_user_permission_id(permissions, email)
-        
-        if not target_permission_id:
-            print(f"❌ No permission found for email: {email}")
-            return False
-        
-        print(f"✅ Found permission ID: {target_permission_id}")
-        
-        # Remove the permission
-        headers = {"Authorization": f"Bearer {access_token}"}
-        permissions_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{item_id}/permissions"
-        delete_url = f"{permissions_url}/{target_permission_id}"
-        print(f"\nRemoving permission via: {delete_url}")
-        
-        try:
-            resp = requests.delete(delete_url, headers=headers, timeout=30)
-            print(f"Response Status: {resp.status_code}")
-            
-            if resp.status_code == 204:
-                print("✅ Successfully removed all permissions!")
-                return True
-            elif resp.status_code == 403:
-                print("❌ Access denied - you may not have permission to modify ACL for this item")
-                return False
-            elif resp.status_code == 404:
-                print("❌ Permission not found - it may have already been removed")
-                return False
-            else:
-                print(f"❌ Failed to remove permission: {resp.status_code}")
-                print(f"Response: {resp.text}")
-                return False
-                
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Network error: {e}")
-            return False
-        except Exception as e:
-            print(f"❌ Unexpected error: {e}")
-            return False
-    
-    return processor
-
-
 def get_item_id(item_path: str, access_token: str) -> Optional[str]:
     """
     Get the item ID for a given path.
     
+    Lookups are reused for ITEM_CACHE_TTL seconds within the process.
+    
     Args:
         item_path: Path to the folder or file in OneDrive
         access_token: OAuth access token
@@ -301,16 +402,22 @@ def get_item_id(item_path: str, access_token: str) -> Optional[str]:
     Returns:
         Item ID if successful, None otherwise
     """
-    headers = {"Authorization": f"Bearer {access_token}"}
-    url = f"https://graph.microsoft.com/v1.0/me/drive/root:/{item_path}"
+    cache_key = (access_token, item_path)
+    cached = _ITEM_ID_CACHE.get(cache_key)
+    if cached and time.monotonic() - cached[0] < ITEM_CACHE_TTL:
+        print(cached[2])
+        return cached[1]
+    
+    headers = auth_headers(access_token)
+    url = f"{GRAPH_BASE_URL}{item_path_endpoint(item_path)}?$select={ITEM_FIELDS}"
     
     try:
-        resp = requests.get(url, headers=headers, timeout=30)
+        resp = SESSION.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
         if resp.status_code != 200:
             _handle_api_error(resp.status_code, resp.text, "get item info")
             return None
         
-        item_data = resp.json()
+        item_data = parse_json_response(resp)
         item_id = item_data.get('id')
         if not item_id:
             print("❌ No item ID found in response")
@@ -318,7 +425,9 @@ def get_item_id(item_path: str, access_token: str) -> Optional[str]:
         
         item_name = item_data.get('name', 'Unknown')
         item_type = 'folder' if 'folder' in item_data else 'file'
-        print(f"✅ Found {item_type}: {item_name} (ID: {item_id})")
+        message = f"✅ Found {item_type}: {item_name} (ID: {item_id})"
+        _ITEM_ID_CACHE[cache_key] = (time.monotonic(), item_id, message)
+        print(message)
         return item_id
         
     except requests.exceptions.RequestException as e:
@@ -330,35 +439,43 @@ def get_item_id(item_path: str, access_token: str) -> Optional[str]:
 
 def _process_single_acl_listing(item_id: str, item_path: str, access_token: str) -> bool:
     """Process ACL listing for a single item. Returns True on success."""
-    permissions_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{item_id}/permissions"
-    print(f"\nGetting ACL from: {permissions_url}")
+    print(f"\nGetting ACL from: {permissions_url(item_id)}")
     
     # Get permissions for this item
     permissions = get_item_permissions(item_id, access_token)
     if permissions is None:
         return False
     
-    if permissions:
-        print(f"\n✅ Found {len(permissions)} permission(s) in ACL:")
-        print("=" * 60)
-        
-        for j, perm in enumerate(permissions, 1):
-            print(f"\nPermission {j}:")
-            print_permission_details(perm)
-            print("-" * 40)
+    # Print each permission as soon as it is parsed; only a count and the
+    # email -> ID map are kept, not the permissions themselves
+    count = 0
+    email_ids = {}
+    for count, perm in enumerate(permissions, 1):
+        if count == 1:
+            print("=" * 60)
+        # One write per permission rather than one per line
+        sys.stdout.write(f"\nPermission {count}:\n{format_permission_details(perm)}{'-' * 40}\n")
+        _index_permission(email_ids, perm)
+    
+    # Let a following 'remove' skip the permissions lookup
+    _remember_permission_ids(item_id, email_ids)
+    
+    if count:
+        print(f"\n✅ Found {count} permission(s) in ACL")
     else:
         print("ℹ️  No permissions found for this item (empty ACL)")
     
     return True
 
 
-def list_item_acl(item_paths: List[str], rclone_remote: str = "OneDrive") -> None:
+def list_item_acl(item_paths: List[str], rclone_remote: str = "OneDrive", by_id: bool = False) -> None:
     """
     List ACL (Access Control List) for one or more OneDrive items.
     
     Args:
         item_paths: List of paths to folders or files in OneDrive
         rclone_remote: Name of the OneDrive remote in rclone.conf
+        by_id: Treat item_paths as drive item IDs (no path lookup)
     """
     print(f"=== OneDrive ACL Lister ===")
     print(f"Items: {', '.join(item_paths)}")
@@ -373,7 +490,93 @@ def list_item_acl(item_paths: List[str], rclone_remote: str = "OneDrive") -> Non
     print("✅ Successfully extracted access token from rclone.conf")
     
     # Process all items using the shared helper
-    process_multiple_items(item_paths, access_token, _process_single_acl_listing, "ACL listing")
+    process_multiple_items(item_paths, access_token, _process_single_acl_listing, "ACL listing", by_id)
+
+def _batch_body_text(body) -> str:
+    """Render a $batch sub-response body for error output."""
+    if isinstance(body, (dict, list)):
+        return json.dumps(body)
+    return str(body) if body is not None else ""
+
+
+def _report_invite_response(status_code: int, invite_response) -> bool:
+    """Print the outcome of a single invite request. Returns True on success."""
+    print(f"Response Status: {status_code}")
+    
+    if status_code == 200:
+        print("✅ Successfully sent invitation for editing permission!")
+        
+        # Show invitation details
+        value = invite_response.get('value', []) if isinstance(invite_response, dict) else []
+        if value:
+            for invite in value:
+                print(f"Invitation sent to: {invite.get('grantedTo', {}).get('user', {}).get('email', 'N/A')}")
+                print(f"Roles: {', '.join(invite.get('roles', []))}")
+                if invite.get('invitation'):
+                    print(f"Invitation URL: {invite['invitation'].get('inviteUrl', 'N/A')}")
+        return True
+    
+    elif status_code == 201:
+        permission = invite_response if isinstance(invite_response, dict) else {}
+        print("✅ Successfully added editing permission!")
+        print(f"Permission ID: {permission.get('id', 'N/A')}")
+        print(f"Roles: {', '.join(permission.get('roles', []))}")
+        
+        # Show granted user info
+        granted_to = permission.get('grantedTo')
+        if granted_to and granted_to.get('user'):
+            user = granted_to['user']
+            print(f"Granted to: {user.get('displayName', 'N/A')} ({user.get('email', 'N/A')})")
+        return True
+    
+    elif status_code == 400:
+        print("❌ Bad request - check the email address format")
+        print(f"Response: {_batch_body_text(invite_response)}")
+    
+    elif status_code == 403:
+        print("❌ Access denied - you may not have permission to modify ACL for this item")
+    
+    elif status_code == 404:
+        print("❌ User not found - the email address may not exist in your organisation")
+    
+    elif status_code == 503:
+        print("❌ Service unavailable - the invitation may still have been sent; check with 'list' before retrying")
+    
+    else:
+        print(f"❌ Failed to add permission: {status_code}")
+        print(f"Response: {_batch_body_text(invite_response)}")
+    
+    return False
+
+
+def _report_folder_invite(folder_path: str, invite: Optional[Dict]) -> bool:
+    """Print the invite outcome for one folder. Returns True on success."""
+    if invite is None:
+        print("❌ Invitation was not sent")
+        return False
+    
+    # A path-addressed invite reports a missing folder as a 404 of its own
+    body = invite.get('body')
+    error = body.get('error') if isinstance(body, dict) else None
+    if invite.get('status') == 404 and isinstance(error, dict) and error.get('code') == 'itemNotFound':
+        print("❌ Item not found - check that the path is correct")
+        print(f"❌ Skipping folder {folder_path}")
+        return False
+    
+    return _report_invite_response(invite.get('status'), body)
+
+
+def _send_single_invite(access_token: str, invite_request: Dict) -> Dict:
+    """POST one invite sub-request directly and return it in $batch sub-response form."""
+    headers = {**auth_headers(access_token), "Content-Type": "application/json"}
+    resp = SESSION.post(f"{GRAPH_BASE_URL}{invite_request['url']}", headers=headers,
+                        data=dump_json(invite_request['body']), timeout=REQUEST_TIMEOUT)
+    try:
+        body = parse_json_response(resp)
+    except ValueError:
+        body = resp.text
+    return {'status': resp.status_code, 'headers': dict(resp.headers), 'body': body}
+
 
 def invite_permission_to_folders(email: str, folder_paths: List[str], rclone_remote: str = "OneDrive") -> None:
     """
@@ -397,95 +600,67 @@ def invite_permission_to_folders(email: str, folder_paths: List[str], rclone_rem
     
     print("✅ Successfully extracted access token from rclone.conf")
     
-    # Process each folder
+    # One body shared by every invite sub-request; it is encoded as part of each
+    # $batch payload in a single dump_json call, not once per folder
+    invite_data = {
+        "requireSignIn": True,
+        "roles": ["write"],
+        "recipients": [
+            {
+                "email": email
+            }
+        ],
+        "message": "You have been granted editing access to this item."
+    }
+    
     successful_invites = 0
     failed_invites = 0
     
-    for i, folder_path in enumerate(folder_paths, 1):
-        print(f"\n--- Processing folder {i}/{len(folder_paths)}: {folder_path} ---")
-        
-        # Get item ID
-        item_id = get_item_id(folder_path, access_token)
-        if not item_id:
-            print(f"❌ Skipping folder {folder_path} - could not get item ID")
-            failed_invites += 1
-            continue
-        
-        # Send invitation (Personal OneDrive)
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        
-        # Send invitation via the invite endpoint (Personal OneDrive)
-        invite_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{item_id}/invite"
-        print(f"Sending invitation via: {invite_url}")
-        
-        invite_data = {
-            "requireSignIn": True,
-            "roles": ["write"],
-            "recipients": [
-                {
-                    "email": email
-                }
-            ],
-            "message": "You have been granted editing access to this item."
+    # Drop duplicates and invalid paths so each folder costs at most one invite
+    folder_paths = _normalize_item_paths(folder_paths)
+    if not folder_paths:
+        print("❌ No valid folder paths given")
+        return
+    
+    # Address each folder by path so Graph resolves it server-side: no ID lookup
+    # round trip, just one $batch call per 20 folders
+    invite_requests = [
+        {
+            "id": str(i),
+            "method": "POST",
+            "url": f"{item_path_endpoint(folder_path)}:/invite",
+            "headers": {"Content-Type": "application/json"},
+            "body": invite_data
         }
+        for i, folder_path in enumerate(folder_paths)
+    ]
+    
+    try:
+        invites = {}
+        if len(invite_requests) == 1:
+            # The usual single-folder case needs no $batch envelope
+            invites = {'0': _send_single_invite(access_token, invite_requests[0])}
+        if not invites or invites['0'].get('status') in INVITE_RETRY_STATUSES:
+            # Several folders, or a throttled single invite: graph_batch chunks, waits and retries
+            print(f"\nSending {len(invite_requests)} invitation(s) via Graph $batch...")
+            invites = graph_batch(access_token, invite_requests, retry_statuses=INVITE_RETRY_STATUSES)
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Network error: {e}")
+        invites = {}
+    # The invited items' IDs are not known here, so drop every cached ACL
+    _PERMISSIONS_CACHE.clear()
+    
+    for i, folder_path in enumerate(folder_paths, 1):
+        # Collect each folder's report and emit it with a single write
+        report = io.StringIO()
+        with redirect_stdout(report):
+            print(f"\n--- Processing folder {i}/{len(folder_paths)}: {folder_path} ---")
+            invited = _report_folder_invite(folder_path, invites.get(str(i - 1)))
+        sys.stdout.write(report.getvalue())
         
-        try:
-            resp = requests.post(invite_url, headers=headers, json=invite_data, timeout=30)
-            print(f"Response Status: {resp.status_code}")
-            
-            if resp.status_code == 200:
-                invite_response = resp.json()
-                print("✅ Successfully sent invitation for editing permission!")
-                
-                # Show invitation details
-                value = invite_response.get('value', [])
-                if value:
-                    for invite in value:
-                        print(f"Invitation sent to: {invite.get('grantedTo', {}).get('user', {}).get('email', 'N/A')}")
-                        print(f"Roles: {', '.join(invite.get('roles', []))}")
-                        if invite.get('invitation'):
-                            print(f"Invitation URL: {invite['invitation'].get('inviteUrl', 'N/A')}")
-                successful_invites += 1
-                
-            elif resp.status_code == 201:
-                permission = resp.json()
-                print("✅ Successfully added editing permission!")
-                print(f"Permission ID: {permission.get('id', 'N/A')}")
-                print(f"Roles: {', '.join(permission.get('roles', []))}")
-                
-                # Show granted user info
-                granted_to = permission.get('grantedTo')
-                if granted_to and granted_to.get('user'):
-                    user = granted_to['user']
-                    print(f"Granted to: {user.get('displayName', 'N/A')} ({user.get('email', 'N/A')})")
-                successful_invites += 1
-                
-            elif resp.status_code == 400:
-                print("❌ Bad request - check the email address format")
-                print(f"Response: {resp.text}")
-                failed_invites += 1
-                
-            elif resp.status_code == 403:
-                print("❌ Access denied - you may not have permission to modify ACL for this item")
-                failed_invites += 1
-                
-            elif resp.status_code == 404:
-                print("❌ User not found - the email address may not exist in your organisation")
-                failed_invites += 1
-                
-            else:
-                print(f"❌ Failed to add permission: {resp.status_code}")
-                print(f"Response: {resp.text}")
-                failed_invites += 1
-                
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Network error: {e}")
-            failed_invites += 1
-        except Exception as e:
-            print(f"❌ Unexpected error: {e}")
+        if invited:
+            successful_invites += 1
+        else:
             failed_invites += 1
     
     # Summary
@@ -499,56 +674,113 @@ def invite_permission_to_folders(email: str, folder_paths: List[str], rclone_rem
     if failed_invites > 0:
         print(f"❌ Failed to invite {email} to {failed_invites} folder(s)")
 
-def _process_single_permission_removal(email: str):
-    """Create a processor function for removing permissions for a specific email."""
+def _remember_permission_ids(item_id: str, email_ids: Dict[str, str]) -> None:
+    """Record the email -> permission ID mapping of an item for later removals."""
+    with _PERMISSION_ID_CACHE_LOCK:
+        cache = load_json_cache(PERMISSION_ID_CACHE)
+        if cache.get(item_id) != email_ids:
+            cache[item_id] = email_ids
+            save_json_cache(PERMISSION_ID_CACHE, cache)
+
+
+def _forget_permission_id(item_id: str, email: str) -> None:
+    """Drop a cached permission ID once it has been removed or found stale."""
+    with _PERMISSION_ID_CACHE_LOCK:
+        cache = load_json_cache(PERMISSION_ID_CACHE)
+        if cache.get(item_id, {}).pop(email.casefold(), None) is not None:
+            save_json_cache(PERMISSION_ID_CACHE, cache)
+
+
+def _report_permission_removal(resp: requests.Response) -> bool:
+    """Print the outcome of a permission DELETE. Returns True on success."""
+    print(f"Response Status: {resp.status_code}")
+    
+    if resp.status_code == 204:
+        print("✅ Successfully removed all permissions!")
+        return True
+    elif resp.status_code == 403:
+        print("❌ Access denied - you may not have permission to modify ACL for this item")
+    elif resp.status_code == 404:
+        print("❌ Permission not found - it may have already been removed")
+    else:
+        print(f"❌ Failed to remove permission: {resp.status_code}")
+        print(f"Response: {resp.text}")
+    return False
+
+
+def _process_single_permission_removal(email: str, permission_id: Optional[str] = None):
+    """
+    Create a processor function for removing permissions for a specific email.
+    
+    When the permission ID is given, or was recorded by an earlier 'list' run,
+    the permissions GET is skipped and the DELETE is issued directly.
+    """
     def processor(item_id: str, item_path: str, access_token: str) -> bool:
-        # Get all permissions to find the one for this email
-        permissions = get_item_permissions(item_id, access_token)
-        if permissions is None:
-            return False
-        
-        # Find permission for the specified email
-        target_permission_id = find_user_permission_id(permissions, email)
-        if not target_permission_id:
-            print(f"❌ No permission found for email: {email}")
-            return False
-        
-        print(f"✅ Found permission ID: {target_permission_id}")
+        headers = auth_headers(access_token)
         
-        # Remove the permission
-        headers = {"Authorization": f"Bearer {access_token}"}
-        permissions_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{item_id}/permissions"
-        delete_url = f"{permissions_url}/{target_permission_id}"
-        print(f"\nRemoving permission via: {delete_url}")
+        target_permission_id = permission_id
+        from_cache = False
+        if target_permission_id:
+            print(f"✅ Using given permission ID: {target_permission_id}")
+        else:
+            target_permission_id = load_json_cache(PERMISSION_ID_CACHE).get(item_id, {}).get(email.casefold())
+            from_cache = bool(target_permission_id)
+            if from_cache:
+                print(f"✅ Using cached permission ID: {target_permission_id}")
         
         try:
-            resp = requests.delete(delete_url, headers=headers, timeout=30)
-            print(f"Response Status: {resp.status_code}")
+            resp = None
+            if target_permission_id:
+                delete_url = f"{permissions_url(item_id)}/{target_permission_id}"
+                print(f"\nRemoving permission via: {delete_url}")
+                resp = SESSION.delete(delete_url, headers=headers, timeout=REQUEST_TIMEOUT)
+                
+                if resp.status_code == 404 and from_cache:
+                    # The ACL changed since it was listed; look the permission up again
+                    print("ℹ️  Cached permission ID is stale, looking it up")
+                    _forget_permission_id(item_id, email)
+                    resp = None
+            
+            if resp is None:
+                # Get all permissions to find the one for this email; it is about
+                # to be removed, so read the current ACL rather than a cached one
+                permissions = get_item_permissions(item_id, access_token, cache=False)
+                if permissions is None:
+                    return False
+                
+                # Find permission for the specified email
+                target_permission_id = find_user_permission_id(permissions, email)
+                if not target_permission_id:
+                    print(f"❌ No permission found for email: {email}")
+                    return False
+                
+                print(f"✅ Found permission ID: {target_permission_id}")
+                
+                # Remove the permission
+                delete_url = f"{permissions_url(item_id)}/{target_permission_id}"
+                print(f"\nRemoving permission via: {delete_url}")
+                resp = SESSION.delete(delete_url, headers=headers, timeout=REQUEST_TIMEOUT)
+            
+            removed = _report_permission_removal(resp)
+            if removed and from_cache:
+                _forget_permission_id(item_id, email)
+            return removed
             
-            if resp.status_code == 204:
-                print("✅ Successfully removed all permissions!")
-                return True
-            elif resp.status_code == 403:
-                print("❌ Access denied - you may not have permission to modify ACL for this item")
-                return False
-            elif resp.status_code == 404:
-                print("❌ Permission not found - it may have already been removed")
-                return False
-            else:
-                print(f"❌ Failed to remove permission: {resp.status_code}")
-                print(f"Response: {resp.text}")
-                return False
         except requests.exceptions.RequestException as e:
             print(f"❌ Network error: {e}")
             return False
         except Exception as e:
             print(f"❌ Unexpected error: {e}")
             return False
+        finally:
+            # A DELETE may have reached Graph even if its response did not arrive
+            _invalidate_item_permissions(item_id)
     
     return processor
 
 
-def remove_permission(email: str, item_paths: List[str], rclone_remote: str = "OneDrive") -> None:
+def remove_permission(email: str, item_paths: List[str], rclone_remote: str = "OneDrive", permission_id: Optional[str] = None,
+                      by_id: bool = False) -> None:
     """
     Remove all permissions for a specific email address from one or more items.
     
@@ -556,13 +788,23 @@ def remove_permission(email: str, item_paths: List[str], rclone_remote: str = "O
         email: Email address to remove permissions for
         item_paths: List of paths to folders or files in OneDrive
         rclone_remote: Name of the OneDrive remote in rclone.conf
+        permission_id: Optional permission ID (e.g. from a previous 'list' run);
+                       skips looking the permission up. A permission ID belongs
+                       to one item, so only a single item may be given with it
+        by_id: Treat item_paths as drive item IDs (no path lookup)
     """
     print(f"=== OneDrive ACL Manager - Remove Permission ===")
     print(f"Email: {email}")
     print(f"Items: {', '.join(item_paths)}")
     print(f"Remote: {rclone_remote}")
+    if permission_id:
+        print(f"Permission ID: {permission_id}")
     print()
     
+    if permission_id and len(dict.fromkeys(item_paths)) > 1:
+        print("❌ --permission-id identifies a permission of one item; give a single item with it")
+        return
+    
     # Get access token
     access_token = get_access_token(rclone_remote)
     if not access_token:
@@ -571,8 +813,8 @@ def remove_permission(email: str, item_paths: List[str], rclone_remote: str = "O
     print("✅ Successfully extracted access token from rclone.conf")
     
     # Process all items using the shared helper
-    processor = _process_single_permission_removal(email)
-    process_multiple_items(item_paths, access_token, processor, f"permission removal for {email}")
+    processor = _process_single_permission_removal(email, permission_id)
+    process_multiple_items(item_paths, access_token, processor, f"permission removal for {email}", by_id)
 
 def bulk_remove_user_access(email: str, rclone_remote: str = "OneDrive", target_dir: Optional[str] = None, dry_run: bool = False) -> None:
     """
@@ -602,7 +844,9 @@ def bulk_remove_user_access(email: str, rclone_remote: str = "OneDrive", target_
     
     # Find all shared folders
     print("🔍 Scanning for shared folders...")
-    shared_folders = scan_shared_folders_recursive(access_token, max_results=1000, target_dir=target_dir)
+    # Only this command scans the drive, so the scanner is imported on demand
+    from .acl_scanner import scan_shared_folders_recursive, filter_folders_by_user
+    shared_folders = scan_shared_folders_recursive(access_token, target_dir=target_dir)
     
     if not shared_folders:
         print("ℹ️  No shared folders found")
@@ -655,34 +899,19 @@ def bulk_remove_user_access(email: str, rclone_remote: str = "OneDrive", target_
         
         try:
             # Get permissions for this folder
-            headers = {"Authorization": f"Bearer {access_token}"}
-            permissions_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{folder['id']}/permissions"
+            headers = auth_headers(access_token)
+            folder_permissions_url = permissions_url(folder['id'])
             
-            resp = requests.get(permissions_url, headers=headers, timeout=30)
+            resp = SESSION.get(permissions_list_url(folder['id']), headers=headers, timeout=REQUEST_TIMEOUT, stream=True)
             if resp.status_code != 200:
                 _handle_api_error(resp.status_code, resp.text, "get permissions")
                 failed_removals += 1
                 continue
             
-            permissions_data = resp.json()
-            permissions = permissions_data.get("value", [])
+            permissions = iter_response_items(resp, headers, stream=True)
             
             # Find permission for the specified email
-            target_permission_id = None
-            for perm in permissions:
-                # Check grantedToIdentities (OneDrive Business)
-                granted_to_identities = perm.get('grantedToIdentities', [])
-                for identity in granted_to_identities:
-                    if identity.get('user') and identity['user'].get('email', '').lower() == email.lower():
-                        target_permission_id = perm.get('id')
-                        break
-                
-                # Check grantedTo (OneDrive Personal)
-                if not target_permission_id:
-                    granted_to = perm.get('grantedTo')
-                    if granted_to and granted_to.get('user') and granted_to['user'].get('email', '').lower() == email.lower():
-                        target_permission_id = perm.get('id')
-                        break
+            target_permission_id = find_user_permission_id(permissions, email)
             
             if not target_permission_id:
                 print(f"❌ No permission found for {email} (may have been removed already)")
@@ -690,8 +919,9 @@ def bulk_remove_user_access(email: str, rclone_remote: str = "OneDrive", target_
                 continue
             
             # Remove the permission
-            delete_url = f"{permissions_url}/{target_permission_id}"
-            del_resp = requests.delete(delete_url, headers=headers, timeout=30)
+            delete_url = f"{folder_permissions_url}/{target_permission_id}"
+            del_resp = SESSION.delete(delete_url, headers=headers, timeout=REQUEST_TIMEOUT)
+            _invalidate_item_permissions(folder['id'])
             
             if del_resp.status_code == 204:
                 print(f"✅ Successfully removed {email}")
@@ -709,6 +939,8 @@ def bulk_remove_user_access(email: str, rclone_remote: str = "OneDrive", target_
                 
         except Exception as e:
             print(f"❌ Error processing folder: {e}")
+            # The DELETE may have reached Graph even if its response did not arrive
+            _invalidate_item_permissions(folder['id'])
             failed_removals += 1
     
     # Summary
@@ -724,17 +956,17 @@ def bulk_remove_user_access(email: str, rclone_remote: str = "OneDrive", target_
 
 def _process_single_metadata(item_id: str, item_path: str, access_token: str) -> bool:
     """Process metadata retrieval for a single item. Returns True on success."""
-    headers = {"Authorization": f"Bearer {access_token}"}
+    headers = auth_headers(access_token)
     # Use expand to get additional metadata including createdBy and lastModifiedBy
-    metadata_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{item_id}?expand=createdBy,lastModifiedBy"
+    metadata_url = f"{GRAPH_BASE_URL}/me/drive/items/{item_id}?expand=createdBy,lastModifiedBy"
     print(f"\nGetting metadata from: {metadata_url}")
     
     try:
-        resp = requests.get(metadata_url, headers=headers, timeout=30)
+        resp = SESSION.get(metadata_url, headers=headers, timeout=REQUEST_TIMEOUT)
         print(f"Response Status: {resp.status_code}")
         
         if resp.status_code == 200:
-            item_data = resp.json()
+            item_data = parse_json_response(resp)
             
             print(f"\n✅ Item Metadata:")
             print("=" * 60)
@@ -873,13 +1105,14 @@ def _process_single_metadata(item_id: str, item_path: str, access_token: str) ->
         return False
 
 
-def get_item_metadata(item_paths: List[str], rclone_remote: str = "OneDrive") -> None:
+def get_item_metadata(item_paths: List[str], rclone_remote: str = "OneDrive", by_id: bool = False) -> None:
     """
     Get metadata information for one or more OneDrive items including creation date, creator, etc.
     
     Args:
         item_paths: List of paths to folders or files in OneDrive
         rclone_remote: Name of the OneDrive remote in rclone.conf
+        by_id: Treat item_paths as drive item IDs (no path lookup)
     """
     print(f"=== OneDrive Item Metadata ===")
     print(f"Items: {', '.join(item_paths)}")
@@ -894,76 +1127,88 @@ def get_item_metadata(item_paths: List[str], rclone_remote: str = "OneDrive") ->
     print("✅ Successfully extracted access token from rclone.conf")
     
     # Process all items using the shared helper
-    process_multiple_items(item_paths, access_token, _process_single_metadata, "metadata retrieval")
+    process_multiple_items(item_paths, access_token, _process_single_metadata, "metadata retrieval", by_id)
 
 def _process_single_strip_permissions(item_id: str, item_path: str, access_token: str) -> bool:
     """Process stripping explicit permissions for a single item. Returns True on success."""
-    permissions_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{item_id}/permissions"
-    print(f"\nGetting ACL from: {permissions_url}")
+    item_permissions_url = permissions_url(item_id)
+    print(f"\nGetting ACL from: {item_permissions_url}")
 
-    # Get permissions for this item
-    permissions = get_item_permissions(item_id, access_token)
+    # Get permissions for this item; they are about to change, so skip the cache
+    permissions = get_item_permissions(item_id, access_token, cache=False)
     if permissions is None:
         return False
 
-    to_remove = []
-    for perm in permissions:
-        # Skip owner permissions
-        roles = perm.get('roles', [])
-        if 'owner' in roles:
-            continue
-        # Skip inherited permissions
-        if perm.get('inheritedFrom'):
-            continue
-        # Otherwise, this is explicit and should be removed
-        to_remove.append(perm.get('id'))
+    # Entries are parsed one at a time; keep only the fields strip reads, not whole entries
+    entries = [
+        (perm.get('id'), perm.get('roles') or [], bool(perm.get('inheritedFrom')))
+        for perm in permissions
+    ]
+    # Explicit permissions are everything that is neither owner nor inherited
+    to_remove = [perm_id for perm_id, roles, inherited in entries if not inherited and 'owner' not in roles]
 
     if not to_remove:
         print("ℹ️  No explicit permissions to remove (only inherited or owner permissions present)")
         return True
 
     print(f"Found {len(to_remove)} explicit permission(s) to remove.")
-    headers = {"Authorization": f"Bearer {access_token}"}
-    removed = 0
     
-    for perm_id in to_remove:
-        delete_url = f"{permissions_url}/{perm_id}"
-        print(f"Removing permission ID: {perm_id} via {delete_url}")
+    # Send all DELETEs through $batch: 20 removals per HTTP call instead of one each
+    item_endpoint = f"/me/drive/items/{item_id}/permissions"
+    delete_requests = [
+        {"id": str(i), "method": "DELETE", "url": f"{item_endpoint}/{perm_id}"}
+        for i, perm_id in enumerate(to_remove)
+    ]
+    # Per-permission lines are collected and written once rather than printed one by one
+    sys.stdout.write("".join(
+        f"Removing permission ID: {perm_id} via {item_permissions_url}/{perm_id}\n" for perm_id in to_remove
+    ))
+    
+    try:
+        deletions = graph_batch(access_token, delete_requests)
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Network error removing permissions: {e}")
+        deletions = {}
+    
+    deleted_ids = set()
+    lines = []
+    for i, perm_id in enumerate(to_remove):
+        deletion = deletions.get(str(i))
+        if deletion is None:
+            lines.append(f"❌ No response for permission ID {perm_id}\n")
+            continue
         
-        try:
-            del_resp = requests.delete(delete_url, headers=headers, timeout=30)
-            if del_resp.status_code == 204:
-                print(f"✅ Removed permission ID: {perm_id}")
-                removed += 1
-            elif del_resp.status_code == 403:
-                print(f"❌ Access denied when removing permission ID: {perm_id}")
-            elif del_resp.status_code == 404:
-                print(f"❌ Permission ID {perm_id} not found (may have already been removed)")
-            else:
-                print(f"❌ Failed to remove permission ID {perm_id}: {del_resp.status_code}")
-                print(f"Response: {del_resp.text}")
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Network error removing {perm_id}: {e}")
+        status_code = deletion.get('status')
+        if status_code == 204:
+            lines.append(f"✅ Removed permission ID: {perm_id}\n")
+            deleted_ids.add(perm_id)
+        elif status_code == 403:
+            lines.append(f"❌ Access denied when removing permission ID: {perm_id}\n")
+        elif status_code == 404:
+            lines.append(f"❌ Permission ID {perm_id} not found (may have already been removed)\n")
+        else:
+            lines.append(f"❌ Failed to remove permission ID {perm_id}: {status_code}\n"
+                         f"Response: {_batch_body_text(deletion.get('body'))}\n")
+    sys.stdout.write("".join(lines))
+    _invalidate_item_permissions(item_id)
 
-    success = removed > 0
+    success = bool(deleted_ids)
     if success:
-        print(f"\n✅ Successfully removed {removed} explicit permission(s) from this item")
+        print(f"\n✅ Successfully removed {len(deleted_ids)} explicit permission(s) from this item")
     else:
         print(f"\n❌ Failed to remove any permissions from this item")
     
-    # List remaining permissions
-    remaining_perms = get_item_permissions(item_id, access_token)
-    if remaining_perms is not None:
-        print(f"Remaining permissions ({len(remaining_perms)}):")
-        for j, perm in enumerate(remaining_perms, 1):
-            print(f"  {j}. ID: {perm.get('id', 'N/A')}, Roles: {', '.join(perm.get('roles', []))}, Inherited: {'Yes' if perm.get('inheritedFrom') else 'No'}")
-    else:
-        print("Could not fetch remaining permissions")
+    # List remaining permissions: the initial ACL minus what was deleted, no second GET
+    remaining_perms = [entry for entry in entries if entry[0] not in deleted_ids]
+    lines = [f"Remaining permissions ({len(remaining_perms)}):\n"]
+    for j, (perm_id, roles, inherited) in enumerate(remaining_perms, 1):
+        lines.append(f"  {j}. ID: {perm_id or 'N/A'}, Roles: {ROLE_SEPARATOR.join(roles)}, Inherited: {'Yes' if inherited else 'No'}\n")
+    sys.stdout.write("".join(lines))
     
     return success
 
 
-def strip_explicit_permissions(item_paths: List[str], rclone_remote: str = "OneDrive") -> None:
+def strip_explicit_permissions(item_paths: List[str], rclone_remote: str = "OneDrive", by_id: bool = False) -> None:
     """
     Remove all explicit (non-inherited, non-owner) permissions from one or more OneDrive items.
     Leaves only inherited permissions (or none if no inherited ACL).
@@ -971,6 +1216,7 @@ def strip_explicit_permissions(item_paths: List[str], rclone_remote: str = "OneD
     Args:
         item_paths: List of paths to folders or files in OneDrive
         rclone_remote: Name of the OneDrive remote in rclone.conf
+        by_id: Treat item_paths as drive item IDs (no path lookup)
     """
     print(f"=== OneDrive ACL Manager - Strip Explicit Permissions ===")
     print(f"Items: {', '.join(item_paths)}")
@@ -985,10 +1231,10 @@ def strip_explicit_permissions(item_paths: List[str], rclone_remote: str = "OneD
     print("✅ Successfully extracted access token from rclone.conf")
 
     # Process all items using the shared helper
-    process_multiple_items(item_paths, access_token, _process_single_strip_permissions, "permission stripping")
+    process_multiple_items(item_paths, access_token, _process_single_strip_permissions, "permission stripping", by_id)
 
-def main():
-    """Main function"""
+def _build_parser() -> argparse.ArgumentParser:
+    """Build the command-line parser; each subcommand sets its handler as 'func'."""
     parser = argparse.ArgumentParser(description="Manage ACL for OneDrive items using rclone.conf token")
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
     
@@ -996,28 +1242,38 @@ def main():
     list_parser = subparsers.add_parser('list', help='List ACL for the specified item(s)')
     list_parser.add_argument("item_paths", nargs="+", help="One or more paths to folders or files in OneDrive")
     list_parser.add_argument("--remote", default=None, help="Name of the OneDrive remote (default: auto-detect)")
+    list_parser.add_argument("--by-id", action="store_true", help="Treat item_paths as drive item IDs (e.g. from 'list') and skip the path lookup")
+    list_parser.set_defaults(func=lambda args: list_item_acl(args.item_paths, args.remote, args.by_id))
     
     # Invite command
     invite_parser = subparsers.add_parser('invite', help='Send invitation with editing permission to multiple folders (Personal OneDrive)')
     invite_parser.add_argument("email", help="Email address to send invitation to")
     invite_parser.add_argument("folder_paths", nargs="+", help="One or more folder paths in OneDrive to grant access to")
     invite_parser.add_argument("--remote", default=None, help="Name of the OneDrive remote (default: auto-detect)")
+    invite_parser.set_defaults(func=lambda args: invite_permission_to_folders(args.email, args.folder_paths, args.remote))
     
     # Remove command
     remove_parser = subparsers.add_parser('remove', help='Remove all permissions for the email from specified item(s)')
     remove_parser.add_argument("email", help="Email address to remove permissions for")
     remove_parser.add_argument("item_paths", nargs="+", help="One or more paths to folders or files in OneDrive")
     remove_parser.add_argument("--remote", default=None, help="Name of the OneDrive remote (default: auto-detect)")
+    remove_parser.add_argument("--permission-id", default=None, help="Permission ID to remove (e.g. from 'list'); skips looking it up. Only with a single item")
+    remove_parser.add_argument("--by-id", action="store_true", help="Treat item_paths as drive item IDs (e.g. from 'list') and skip the path lookup")
+    remove_parser.set_defaults(func=lambda args: remove_permission(args.email, args.item_paths, args.remote, args.permission_id, args.by_id))
 
     # Meta command
     meta_parser = subparsers.add_parser('meta', help='Show metadata information for the specified item(s) (creation date, creator, etc.)')
     meta_parser.add_argument("item_paths", nargs="+", help="One or more paths to folders or files in OneDrive")
     meta_parser.add_argument("--remote", default=None, help="Name of the OneDrive remote (default: auto-detect)")
+    meta_parser.add_argument("--by-id", action="store_true", help="Treat item_paths as drive item IDs (e.g. from 'list') and skip the path lookup")
+    meta_parser.set_defaults(func=lambda args: get_item_metadata(args.item_paths, args.remote, args.by_id))
     
     # Strip command
     strip_parser = subparsers.add_parser('strip', help='Remove all explicit (non-inherited) permissions from the specified item(s)')
     strip_parser.add_argument("item_paths", nargs="+", help="One or more paths to folders or files in OneDrive")
     strip_parser.add_argument("--remote", default=None, help="Name of the OneDrive remote (default: auto-detect)")
+    strip_parser.add_argument("--by-id", action="store_true", help="Treat item_paths as drive item IDs (e.g. from 'list') and skip the path lookup")
+    strip_parser.set_defaults(func=lambda args: strip_explicit_permissions(args.item_paths, args.remote, args.by_id))
     
     # Bulk remove user command
     bulk_remove_parser = subparsers.add_parser('bulk-remove-user', help='Find and remove a user from all shared folders')
@@ -1025,37 +1281,27 @@ def main():
     bulk_remove_parser.add_argument("--target-dir", help="Optional: limit search to this directory")
     bulk_remove_parser.add_argument("--dry-run", action="store_true", help="Show what would be removed without making changes")
     bulk_remove_parser.add_argument("--remote", default=None, help="Name of the OneDrive remote (default: auto-detect)")
+    bulk_remove_parser.set_defaults(func=lambda args: bulk_remove_user_access(args.email, args.remote, args.target_dir, args.dry_run))
     
+    return parser
+
+def main():
+    """Main function"""
+    parser = _build_parser()
     args = parser.parse_args()
     
     if not args.command:
         parser.print_help()
         return
     
+    # Connect to Graph while the token is read from rclone.conf
+    prewarm_session()
+    
     print("OneDrive ACL Manager")
     print("=" * 50)
     
-    # Check if requests is available
-    try:
-        import requests
-    except ImportError:
-        print("❌ requests library not found")
-        print("Please install it: pip install requests")
-        return
-    
     # Execute the appropriate command
-    if args.command == 'list':
-        list_item_acl(args.item_paths, args.remote)
-    elif args.command == 'invite':
-        invite_permission_to_folders(args.email, args.folder_paths, args.remote)
-    elif args.command == 'remove':
-        remove_permission(args.email, args.item_paths, args.remote)
-    elif args.command == 'meta':
-        get_item_metadata(args.item_paths, args.remote)
-    elif args.command == 'strip':
-        strip_explicit_permissions(args.item_paths, args.remote)
-    elif args.command == 'bulk-remove-user':
-        bulk_remove_user_access(args.email, args.remote, args.target_dir, args.dry_run)
+    args.func(args)
     
     print("\n=== ACL Management Complete ===")
     print("This demonstrates direct access to OneDrive ACL via Microsoft Graph API")
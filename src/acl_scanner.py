@@ -20,7 +20,12 @@ Usage:
 Options:
     --remote REMOTE_NAME    OneDrive remote name (default: OneDrive)
     --max-results N         Maximum results to return (default: 1000)
+    --max-depth N           Maximum depth to scan (default: 3, 0 = unlimited)
     --only-user EMAIL       Filter to show only folders shared with specific user
+    --qps N                 Maximum Graph requests per second (default: 20, 0 = unlimited)
+    --delta                 Enumerate folders with a delta query cached between runs
+    --force-check-all       Request permissions of every folder, not only those marked as shared
+    --output FILE           Write each shared folder to FILE as a JSON line as soon as it is found
     dirname                 Optional: scan only under this directory path
     
 Examples:
@@ -32,15 +37,43 @@ Examples:
     python -m src.acl_scanner --remote "MyOneDrive"
 """
 
-import requests
-import json
 import sys
+
+try:
+    import requests
+except ImportError:
+    sys.exit("❌ requests library not found\nPlease install it: pip install requests")
+
+import json
 import argparse
 import os
-from typing import Dict, List, Optional, Set, Tuple
-from urllib.parse import quote
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 import time
-from .config_utils import get_access_token
+from concurrent.futures import ThreadPoolExecutor
+from .config_utils import get_access_token, load_json_cache, refresh_access_token, save_json_cache
+from .graph_utils import (
+    DEFAULT_QPS, GRAPH_BASE_URL, PERMISSION_FIELDS, REQUEST_TIMEOUT, SESSION, auth_headers, dump_json, graph_batch,
+    item_path_endpoint, iter_batch_items, iter_response_items, parse_json_response, permissions_list_url,
+    prewarm_session, set_request_rate
+)
+
+# Concurrent permission fetches; OneDrive throttles a user beyond a handful of parallel requests
+MAX_PERMISSION_WORKERS = 5
+
+# Role marking the drive owner's own permission, which is not sharing
+OWNER_ROLE = 'owner'
+
+# Fields the recursive scan reads from a folder's children
+CHILD_FIELDS = "id,name,folder,shared"
+
+# Minimum seconds between two updates of the scan's progress line
+PROGRESS_INTERVAL = 0.5
+
+# Cache file holding, per remote, the drive's folder tree and the delta link that updates it
+FOLDER_INDEX_CACHE = "folder_index.json"
+
+# Fields read from delta query items; 'deleted' marks items removed since the last query
+DELTA_FIELDS = "id,name,folder,shared,parentReference,deleted"
 
 
 
@@ -56,12 +89,12 @@ def analyze_permissions(permissions: List[Dict]) -> Tuple[bool, bool, int, List[
     """
     has_link_sharing = False
     has_direct_sharing = False
-    shared_users = []
+    # Insertion-ordered set: keeps first-seen order with O(1) duplicate checks
+    shared_users = {}
     
     for perm in permissions:
         # Skip owner permissions (identified by "owner" role)
-        roles = perm.get('roles', [])
-        if 'owner' in roles:
+        if OWNER_ROLE in perm.get('roles', ()):
             continue
         
         # Check if this is a link permission
@@ -69,268 +102,526 @@ def analyze_permissions(permissions: List[Dict]) -> Tuple[bool, bool, int, List[
         if link and link.get('type'):
             has_link_sharing = True
         
-        # Check if this is a direct permission
+        # Direct permissions: grantedTo, plus grantedToIdentities (OneDrive Business)
+        granted_to = perm.get('grantedTo')
+        grantees = [granted_to] if granted_to else []
+        grantees.extend(perm.get('grantedToIdentities', ()))
+        for grantee in grantees:
+            user = grantee.get('user')
+            if user:
+                has_direct_sharing = True
+                shared_users.setdefault(user.get('email', user.get('displayName', 'Unknown')))
+    
+    return has_link_sharing, has_direct_sharing, len(permissions), list(shared_users)
+
+def has_any_sharing(permissions: List[Dict]) -> bool:
+    """
+    Check whether permissions share an item via a link or with a user, as analyze_permissions counts it.
+    
+    Stops at the first such permission instead of collecting the full user list.
+    """
+    for perm in permissions:
+        if OWNER_ROLE in perm.get('roles', ()):
+            continue
+        
+        link = perm.get('link')
+        if link and link.get('type'):
+            return True
+        
+        granted_to = perm.get('grantedTo')
+        if granted_to and granted_to.get('user'):
+            return True
+        if any(identity.get('user') for identity in perm.get('grantedToIdentities', ())):
+            return True
+    
+    return False
+
+def batch_get_folder_contents(item_ids: List[str], folders: List[Tuple[str, str]], access_token: str
+                              ) -> Tuple[Dict[str, Optional[List[Dict]]], Dict[str, Optional[List[Tuple[str, str, bool]]]]]:
+    """
+    Get the permissions of several items and the subfolders of several folders through Graph $batch.
+    
+    Both kinds of requests share the same batches, so up to 20 of them travel
+    in one HTTP request (see graph_batch, which also re-submits sub-requests
+    throttled with 429/503); collections longer than one page are completed
+    with follow-up GETs.
+    
+    Args:
+        item_ids: IDs of the items whose permissions to get; repeated IDs are requested once
+        folders: (id, path) of the folders whose subfolders to list
+        access_token: OAuth access token for Graph API
+    
+    Returns:
+        Tuple of two dicts: item ID to its permissions, and folder ID to its subfolders
+        as (id, path, has_shared_facet) tuples; either is None if it could not be read
+    """
+    # A listing can name the same item twice (e.g. when it changes between pages)
+    item_ids = list(dict.fromkeys(item_ids))
+    folders = list(dict(folders).items())
+    if not item_ids and not folders:
+        return {}, {}
+    
+    headers = auth_headers(access_token)
+    subrequests = [
+        {"id": f"p{i}", "method": "GET", "url": f"/me/drive/items/{item_id}/permissions?$select={PERMISSION_FIELDS}"}
+        for i, item_id in enumerate(item_ids)
+    ] + [
+        {"id": f"c{i}", "method": "GET", "url": f"/me/drive/items/{folder_id}/children?$select={CHILD_FIELDS}"}
+        for i, (folder_id, _) in enumerate(folders)
+    ]
+    responses = graph_batch(access_token, subrequests)
+    
+    def collection(subrequest_id: str) -> Optional[List[Dict]]:
+        response = responses.get(subrequest_id, {})
+        body = response.get('body')
+        if response.get('status') != 200 or not isinstance(body, dict):
+            return None
+        try:
+            return list(iter_batch_items(body, headers, prefetch=True))
+        except requests.exceptions.RequestException:
+            return None
+    
+    permissions = {item_id: collection(f"p{i}") for i, item_id in enumerate(item_ids)}
+    subfolders = {}
+    for i, (folder_id, folder_path) in enumerate(folders):
+        children = collection(f"c{i}")
+        subfolders[folder_id] = None if children is None else _child_folder_entries(children, folder_path)
+    return permissions, subfolders
+
+def is_explicitly_shared_with(permissions: List[Dict], target_user_lower: str) -> bool:
+    """Check whether the permissions grant target_user_lower access directly, not by inheritance."""
+    for perm in permissions:
+        # Skip owner permissions
+        roles = perm.get('roles', [])
+        if OWNER_ROLE in roles:
+            continue
+        
+        # Check if this permission is inherited (has inheritedFrom property)
+        inherited_from = perm.get('inheritedFrom')
+        if inherited_from:
+            # This permission is inherited, skip it
+            continue
+        
+        # Check direct user permissions
         granted_to = perm.get('grantedTo')
         if granted_to and granted_to.get('user'):
             user = granted_to['user']
-            has_direct_sharing = True
-            email = user.get('email', user.get('displayName', 'Unknown'))
-            if email not in shared_users:
-                shared_users.append(email)
+            user_email = user.get('email', '').lower()
+            if target_user_lower in user_email:
+                return True
         
         # Check grantedToIdentities (OneDrive Business)
         granted_to_identities = perm.get('grantedToIdentities', [])
         for identity in granted_to_identities:
             if identity.get('user'):
                 user = identity['user']
-                has_direct_sharing = True
-                email = user.get('email', user.get('displayName', 'Unknown'))
-                if email not in shared_users:
-                    shared_users.append(email)
+                user_email = user.get('email', '').lower()
+                if target_user_lower in user_email:
+                    return True
     
-    return has_link_sharing, has_direct_sharing, len(permissions), shared_users
+    return False
+
+def _child_folder_entries(children: Iterable[Dict], folder_path: str) -> List[Tuple[str, str, bool]]:
+    """Turn the children of a folder into (id, path, has_shared_facet) tuples for its subfolders."""
+    child_folders = []
+    for child in children:
+        if 'folder' in child:
+            child_id = child.get('id')
+            child_name = child.get('name', 'Unknown')
+            child_path = f"{folder_path}/{child_name}" if folder_path else child_name
+            child_folders.append((child_id, child_path, 'shared' in child))
+    return child_folders
 
-def get_item_path(item_id: str, access_token: str) -> str:
-    """Get the full path of an item using its parent chain."""
-    headers = {"Authorization": f"Bearer {access_token}"}
-    path_parts = []
-    current_id = item_id
+def sync_folder_index(access_token: str, remote: Optional[str] = None) -> Optional[Dict[str, List[Tuple[str, str, bool]]]]:
+    """
+    Bring the cached folder tree of a remote up to date with a delta query.
+    
+    The first run enumerates the whole drive, about 200 items per request;
+    the @odata.deltaLink returned at the end is saved with the tree, so later
+    runs only download what changed since. If Graph answers 410 Gone the saved
+    link has expired and the tree is rebuilt from scratch.
+    
+    Args:
+        access_token: OAuth access token for Graph API
+        remote: Name of the rclone remote the tree is cached under
+    
+    Returns:
+        Dict mapping each folder ID to its subfolders as (id, name, has_shared_facet)
+        tuples, or None if the drive could not be enumerated
+    """
+    headers = auth_headers(access_token)
+    full_sync_url = f"{GRAPH_BASE_URL}/me/drive/root/delta?$select={DELTA_FIELDS}"
+    cache = load_json_cache(FOLDER_INDEX_CACHE)
+    saved = cache.get(remote or "") or {}
+    
+    # folder ID -> [parent ID, name, has_shared_facet]
+    folders = saved.get('folders') or {}
+    url = saved.get('delta_link')
+    if not url:
+        folders = {}
+        url = full_sync_url
     
     try:
-        while current_id:
-            url = f"https://graph.microsoft.com/v1.0/me/drive/items/{current_id}"
-            resp = requests.get(url, headers=headers, timeout=30)
-            
+        while True:
+            resp = SESSION.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+            if resp.status_code == 410 and url != full_sync_url:
+                # The saved delta link expired: enumerate the drive again
+                print("⚠️  Saved folder index expired, rebuilding it")
+                folders = {}
+                url = full_sync_url
+                continue
             if resp.status_code != 200:
-                break
+                print(f"⚠️  Delta query failed: {resp.status_code}")
+                return None
             
-            item_data = resp.json()
-            name = item_data.get('name', 'Unknown')
-            path_parts.insert(0, name)
-            
-            parent_ref = item_data.get('parentReference')
-            if not parent_ref or parent_ref.get('path') == '/drive/root:':
-                break
+            page = parse_json_response(resp)
+            for item in page.get('value', []):
+                item_id = item.get('id')
+                if 'deleted' in item or 'folder' not in item:
+                    folders.pop(item_id, None)
+                else:
+                    parent_id = (item.get('parentReference') or {}).get('id')
+                    folders[item_id] = [parent_id, item.get('name', 'Unknown'), 'shared' in item]
             
-            current_id = parent_ref.get('id')
-            if not current_id:
+            url = page.get('@odata.nextLink')
+            if not url:
+                delta_link = page.get('@odata.deltaLink')
                 break
-        
-        # Remove 'root' from path if present
-        if path_parts and path_parts[0].lower() == 'root':
-            path_parts = path_parts[1:]
-        
-        return '/'.join(path_parts) if path_parts else 'Unknown'
     
-    except Exception:
-        return 'Unknown'
+    except requests.exceptions.RequestException as e:
+        print(f"⚠️  Delta query failed: {e}")
+        return None
+    
+    cache[remote or ""] = {'delta_link': delta_link, 'folders': folders}
+    save_json_cache(FOLDER_INDEX_CACHE, cache)
+    
+    subfolders = {}
+    for folder_id, (parent_id, name, has_shared_facet) in folders.items():
+        subfolders.setdefault(parent_id, []).append((folder_id, name, has_shared_facet))
+    return subfolders
 
-def scan_shared_folders_recursive(access_token: str, max_depth: int = 3, target_dir: Optional[str] = None, only_user: Optional[str] = None) -> List[Dict]:
+class ScanProgress:
     """
-    Recursively scan OneDrive for all shared folders by traversing the folder structure up to max_depth.
+    "Folders checked" counter redrawn in place on stderr, at most every PROGRESS_INTERVAL.
+    
+    Only shown when stderr is a terminal, so redirected output stays clean.
+    """
+    
+    def __init__(self):
+        self.enabled = sys.stderr.isatty()
+        self._last_update = 0.0
+        self._shown = False
+    
+    def update(self, checked: int) -> None:
+        """Redraw the counter unless it was redrawn less than PROGRESS_INTERVAL ago."""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if now - self._last_update < PROGRESS_INTERVAL:
+            return
+        self._last_update = now
+        sys.stderr.write(f"\r   ⏳ {checked} folders checked...")
+        sys.stderr.flush()
+        self._shown = True
+    
+    def clear(self) -> None:
+        """Erase the counter line so that a regular message can be printed."""
+        if self._shown:
+            sys.stderr.write("\r\033[K")
+            sys.stderr.flush()
+            self._shown = False
+
+def scan_shared_folders_recursive(access_token: str, max_depth: int = 3, target_dir: Optional[str] = None, only_user: Optional[str] = None,
+                                  folder_index: Optional[Dict[str, List[Tuple[str, str, bool]]]] = None,
+                                  check_all: bool = False, output_path: Optional[str] = None) -> List[Dict]:
+    """
+    Scan OneDrive for all shared folders by walking the folder tree level by level up to max_depth.
     When only_user is specified, implements smart pruning: skips subfolders when explicit permissions are found.
     
     Args:
         access_token: OAuth access token for Graph API
-        max_depth: Maximum depth to scan (default: 3)
+        max_depth: Maximum depth to scan (default: 3; 0 = no limit)
         target_dir: Optional directory path to scan under (e.g., "Documents/Projects")
         only_user: Optional email to filter results by user (enables pruning optimization)
+        folder_index: Optional folder tree from sync_folder_index; subfolders are then
+                      taken from it instead of listing every folder's children
+        check_all: Request the permissions of every folder, even those whose missing
+                   'shared' facet shows they hold owner access only
+        output_path: Optional file to write each shared folder to as one JSON line as
+                     soon as it is found, so an interrupted scan keeps its results
     """
-    print(f"🔍 Scanning OneDrive for shared folders recursively (max depth: {max_depth})...")
+    print(f"🔍 Scanning OneDrive for shared folders recursively (max depth: {max_depth or 'unlimited'})...")
     if only_user:
         print(f"🎯 Filtering for user: {only_user} (with pruning optimization)")
     
-    headers = {"Authorization": f"Bearer {access_token}"}
+    headers = auth_headers(access_token)
+    # The walk is iterative, so the depth needs no limit besides the one asked for
+    depth_limit = max_depth if max_depth > 0 else float('inf')
     shared_folders = []
     checked_folders = set()  # Track checked folders to avoid duplicates
     folders_per_level = {}  # Track folder counts per level
+    unreadable_folders = []  # Folders whose permissions or children could not be read
     target_user_lower = only_user.lower() if only_user else None
+    progress = ScanProgress()
     
-    def check_folder_recursive(folder_id: str, folder_path: str = "", current_depth: int = 0):
-        """Recursively check a folder and all its subfolders for sharing."""
-        if current_depth >= max_depth or folder_id in checked_folders:
-            return
+    results_file = None
+    if output_path:
+        try:
+            results_file = open(output_path, 'wb')
+            print(f"💾 Writing results to {output_path} as they are found")
+        except OSError as e:
+            print(f"⚠️  Cannot write results to {output_path}: {e}")
+    
+    def report(message: str) -> None:
+        """Print a scan message, taking the progress line out of the way first."""
+        progress.clear()
+        print(message)
+    
+    def write_result(folder: Dict) -> None:
+        """Append a found folder to the output file; on a write error, warn once and stop writing."""
+        nonlocal results_file
+        try:
+            results_file.write(dump_json(folder) + b"\n")
+            results_file.flush()
+        except OSError as e:
+            # Not a Graph failure: the scan goes on, the results are still reported at the end
+            report(f"⚠️  Cannot write results to {output_path}: {e}; no longer writing to it")
+            try:
+                results_file.close()
+            except OSError:
+                pass
+            results_file = None
+    
+    def check_folder(folder_id: str, folder_path: str, permissions: Optional[List[Dict]]) -> Tuple[bool, bool]:
+        """
+        Check one folder's permissions and record it if it is shared.
         
-        checked_folders.add(folder_id)
+        Returns:
+            Tuple of (descend, folder_shared): whether its subfolders are to be scanned
+            (not when only_user pruning applies) and whether they may inherit anything
+            but owner access from it
+        """
+        if permissions is None:
+            # Still descend: the children may be readable even if this ACL is not
+            unreadable_folders.append(folder_path or '/')
+            return True, True
         
-        # Track folder count per level
-        if current_depth not in folders_per_level:
-            folders_per_level[current_depth] = 0
-        folders_per_level[current_depth] += 1
+        # Whether anything but owner access is granted decides the traversal; the
+        # full analysis (users, sharing types) is only needed for reported folders
+        folder_shared = has_any_sharing(permissions)
         
-        try:
-            # Get permissions for this folder
-            permissions_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{folder_id}/permissions"
-            perm_resp = requests.get(permissions_url, headers=headers, timeout=30)
+        # Check for explicit user permissions if only_user is specified
+        has_explicit_user_permission = False
+        if target_user_lower:
+            has_explicit_user_permission = is_explicitly_shared_with(permissions, target_user_lower)
+        
+        # Determine if this folder should be included in results
+        should_include_folder = False
+        if target_user_lower:
+            # When filtering by user, only include if explicit permission found
+            should_include_folder = has_explicit_user_permission
+        else:
+            # When not filtering by user, include all shared folders
+            should_include_folder = folder_shared
+        
+        if should_include_folder:
+            has_link, has_direct, perm_count, shared_users = analyze_permissions(permissions)
             
-            if perm_resp.status_code == 200:
-                permissions_data = perm_resp.json()
-                permissions = permissions_data.get("value", [])
+            # Validate that shared_users is not empty
+            if not shared_users:
+                report(f"   ❌ ERROR: Folder '{folder_path or folder_id}' has sharing enabled but empty shared_users list!")
+                report(f"   This indicates a bug in the permission analysis logic.")
+            else:
+                # The path was built from the names in the parents' listings, so the name is
+                # its last component; only the drive root (Graph names it "root") has none
+                if folder_path:
+                    folder_name = folder_path.rsplit('/', 1)[-1]
+                else:
+                    folder_path = '/'
+                    folder_name = 'root'
                 
-                # Analyze permissions
-                has_link, has_direct, perm_count, shared_users = analyze_permissions(permissions)
+                # Determine symbol and sharing type
+                if has_link:
+                    symbol = "🔗"
+                    share_type = "Link sharing"
+                else:
+                    symbol = "👥"
+                    share_type = "Direct permissions"
                 
-                # Check for explicit user permissions if only_user is specified
-                has_explicit_user_permission = False
-                if target_user_lower:
-                    for perm in permissions:
-                        # Skip owner permissions
-                        roles = perm.get('roles', [])
-                        if 'owner' in roles:
-                            continue
-                        
-                        # Check if this permission is inherited (has inheritedFrom property)
-                        inherited_from = perm.get('inheritedFrom')
-                        if inherited_from:
-                            # This permission is inherited, skip it
-                            continue
-                        
-                        # Check direct user permissions
-                        granted_to = perm.get('grantedTo')
-                        if granted_to and granted_to.get('user'):
-                            user = granted_to['user']
-                            user_email = user.get('email', '').lower()
-                            if target_user_lower in user_email:
-                                has_explicit_user_permission = True
-                                break
-                        
-                        # Check grantedToIdentities (OneDrive Business)
-                        granted_to_identities = perm.get('grantedToIdentities', [])
-                        for identity in granted_to_identities:
-                            if identity.get('user'):
-                                user = identity['user']
-                                user_email = user.get('email', '').lower()
-                                if target_user_lower in user_email:
-                                    has_explicit_user_permission = True
-                                    break
-                        
-                        if has_explicit_user_permission:
-                            break
+                # folder_id came from the parent's listing in this same drive, so it
+                # already is the ID the path resolves to; no need to look it up again
+                shared_folders.append({
+                    'path': folder_path,
+                    'name': folder_name,
+                    'id': folder_id,
+                    'symbol': symbol,
+                    'share_type': share_type,
+                    'has_link_sharing': has_link,
+                    'has_direct_sharing': has_direct,
+                    'permission_count': perm_count,
+                    'shared_users': shared_users
+                })
+                if results_file:
+                    write_result(shared_folders[-1])
                 
-                # Determine if this folder should be included in results
-                should_include_folder = False
-                if target_user_lower:
-                    # When filtering by user, only include if explicit permission found
-                    should_include_folder = has_explicit_user_permission
+                if target_user_lower and has_explicit_user_permission:
+                    report(f"   ✅ Found explicit permission: {symbol} {folder_path}")
                 else:
-                    # When not filtering by user, include all shared folders
-                    should_include_folder = has_link or has_direct
+                    report(f"   ✅ Found shared: {symbol} {folder_path}")
+        
+        # Implement pruning: if explicit user permission found, skip children
+        if target_user_lower and has_explicit_user_permission:
+            report(f"   🚀 Pruning: Found explicit permission, skipping subfolders (inherited)")
+            return False, folder_shared
+        
+        return True, folder_shared
+    
+    def fetch_contents(item_ids: List[str], folders: List[Tuple[str, str]]):
+        """batch_get_folder_contents, with a failed batch call reported as unreadable items."""
+        try:
+            return batch_get_folder_contents(item_ids, folders, access_token)
+        except requests.exceptions.RequestException:
+            return dict.fromkeys(item_ids), dict.fromkeys(folder_id for folder_id, _ in folders)
+    
+    def scan_from(start_id: str, start_path: str) -> None:
+        """
+        Scan the tree under a folder level by level, batching requests across the whole level.
+        
+        Permissions and children listings of every folder on a level, whatever
+        their parent, share the same $batch calls (20 sub-requests each), so a
+        level costs about ceil(folders / 20) round trips instead of one per parent.
+        """
+        # Folders of the level being checked: (id, path, permissions, subfolders or None
+        # if not listed yet, tree-order key used to report results depth-first)
+        level = [(start_id, start_path, fetch_contents([start_id], [])[0][start_id], None, ())]
+        depth = 0
+        
+        nonlocal access_token
+        while level and depth < depth_limit:
+            # A full scan can outlive the token; swap in a fresh one before it expires
+            progress.clear()
+            access_token = refresh_access_token(access_token)
+            
+            # Check this level's folders; keep those whose subfolders are to be scanned
+            expand = []
+            for folder_id, folder_path, permissions, subfolders, order_key in level:
+                if folder_id in checked_folders:
+                    continue
+                checked_folders.add(folder_id)
+                progress.update(len(checked_folders))
+                folders_per_level[depth] = folders_per_level.get(depth, 0) + 1
                 
-                if should_include_folder:
-                    # Validate that shared_users is not empty
-                    if not shared_users:
-                        print(f"   ❌ ERROR: Folder '{folder_path or folder_id}' has sharing enabled but empty shared_users list!")
-                        print(f"   This indicates a bug in the permission analysis logic.")
-                    else:
-                        # Get full path if not already provided
-                        if not folder_path:
-                            folder_path = get_item_path(folder_id, access_token)
-                        
-                        # Get folder name
-                        folder_info_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{folder_id}"
-                        info_resp = requests.get(folder_info_url, headers=headers, timeout=30)
-                        folder_name = "Unknown"
-                        if info_resp.status_code == 200:
-                            folder_data = info_resp.json()
-                            folder_name = folder_data.get('name', 'Unknown')
-                        
-                        # Determine symbol and sharing type
-                        if has_link:
-                            symbol = "🔗"
-                            share_type = "Link sharing"
-                        else:
-                            symbol = "👥"
-                            share_type = "Direct permissions"
-                        
-                        # Get the folder ID by path to ensure consistency
-                        consistent_folder_id = folder_id
-                        if folder_path:
-                            try:
-                                path_url = f"https://graph.microsoft.com/v1.0/me/drive/root:/{folder_path}"
-                                path_resp = requests.get(path_url, headers=headers, timeout=30)
-                                if path_resp.status_code == 200:
-                                    path_data = path_resp.json()
-                                    consistent_folder_id = path_data.get('id', folder_id)
-                            except Exception:
-                                # Fall back to original folder_id if path lookup fails
-                                consistent_folder_id = folder_id
-                        
-                        shared_folders.append({
-                            'path': folder_path,
-                            'name': folder_name,
-                            'id': consistent_folder_id,
-                            'symbol': symbol,
-                            'share_type': share_type,
-                            'has_link_sharing': has_link,
-                            'has_direct_sharing': has_direct,
-                            'permission_count': perm_count,
-                            'shared_users': shared_users
-                        })
-                        
-                        if target_user_lower and has_explicit_user_permission:
-                            print(f"   ✅ Found explicit permission: {symbol} {folder_path}")
-                        else:
-                            print(f"   ✅ Found shared: {symbol} {folder_path}")
+                found = len(shared_folders)
+                try:
+                    descend, folder_shared = check_folder(folder_id, folder_path, permissions)
+                except Exception:
+                    # Skip folders we can't access, but report them with the results
+                    unreadable_folders.append(folder_path or '/')
+                    continue
+                finally:
+                    # Whatever check_folder recorded before an error keeps its place too
+                    result_order.extend([order_key] * (len(shared_folders) - found))
                 
-                # Implement pruning: if explicit user permission found, skip children
-                if target_user_lower and has_explicit_user_permission:
-                    print(f"   🚀 Pruning: Found explicit permission, skipping subfolders (inherited)")
-                    return  # Skip scanning children
+                # Subfolders beyond max_depth are never checked, so do not list them
+                if descend and depth + 1 < depth_limit:
+                    expand.append((folder_id, folder_path, subfolders, folder_shared, order_key))
             
-            # Get children of this folder and recursively check them
-            children_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{folder_id}/children"
-            children_resp = requests.get(children_url, headers=headers, timeout=30)
+            # Subfolders not fetched ahead (or all of them, from the delta index)
+            if folder_index is not None:
+                listings = {
+                    folder_id: [(child_id, f"{folder_path}/{child_name}" if folder_path else child_name, has_shared_facet)
+                                for child_id, child_name, has_shared_facet in folder_index.get(folder_id, ())]
+                    for folder_id, folder_path, _, _, _ in expand
+                }
+            else:
+                listings = fetch_contents([], [(folder_id, folder_path) for folder_id, folder_path, subfolders, _, _ in expand
+                                                if subfolders is None])[1]
             
-            if children_resp.status_code == 200:
-                children_data = children_resp.json()
-                children = children_data.get("value", [])
+            next_level = []
+            known_permissions = {}
+            for folder_id, folder_path, subfolders, folder_shared, order_key in expand:
+                if subfolders is None:
+                    subfolders = listings.get(folder_id)
+                if subfolders is None:
+                    unreadable_folders.append(folder_path or '/')
+                    continue
                 
-                for child in children:
-                    if 'folder' in child:
-                        child_id = child.get('id')
-                        child_name = child.get('name', 'Unknown')
-                        child_path = f"{folder_path}/{child_name}" if folder_path else child_name
-                        
-                        # Recursively check this child folder
-                        check_folder_recursive(child_id, child_path, current_depth + 1)
-        
-        except Exception as e:
-            # Skip folders we can't access
-            pass
+                # A subfolder without a 'shared' facet has no permissions of its own, so
+                # unless it inherits some from this folder (and inherited access counts,
+                # i.e. without only_user) it holds owner access only: skip its ACL request
+                inherits_sharing = check_all or (folder_shared and not target_user_lower)
+                for index, (child_id, child_path, has_shared_facet) in enumerate(subfolders):
+                    if child_id in checked_folders:
+                        continue
+                    if not has_shared_facet and not inherits_sharing:
+                        known_permissions[child_id] = []
+                    next_level.append((child_id, child_path, order_key + (index,)))
+            
+            # The next level's own children are needed unless the depth limit stops there.
+            # Those listings ride in the same batches as the permissions, except for
+            # subfolders that only_user may prune: they are listed once their ACL is known
+            list_children = folder_index is None and depth + 2 < depth_limit
+            prelisted = [(child_id, child_path) for child_id, child_path, _ in next_level
+                         if list_children and not (target_user_lower and child_id not in known_permissions)]
+            
+            # Fetch the remaining permissions and the listings, 20 sub-requests per HTTP request
+            permissions, prelistings = fetch_contents(
+                [child_id for child_id, _, _ in next_level if child_id not in known_permissions], prelisted
+            )
+            permissions.update(known_permissions)
+            
+            level = [(child_id, child_path, permissions.get(child_id), prelistings.get(child_id), order_key)
+                     for child_id, child_path, order_key in next_level]
+            depth += 1
+    
+    # Tree-order key of each entry of shared_folders
+    result_order = []
     
     # Start from target directory or root
     try:
         if target_dir:
             # Get the target directory by path
-            target_url = f"https://graph.microsoft.com/v1.0/me/drive/root:/{target_dir}"
-            resp = requests.get(target_url, headers=headers, timeout=30)
+            target_url = f"{GRAPH_BASE_URL}{item_path_endpoint(target_dir)}?$select=id"
+            resp = SESSION.get(target_url, headers=headers, timeout=REQUEST_TIMEOUT)
             
             if resp.status_code == 200:
-                target_data = resp.json()
+                target_data = parse_json_response(resp)
                 target_id = target_data.get('id')
                 
                 print(f"📂 Starting recursive search from directory: {target_dir}")
-                check_folder_recursive(target_id, target_dir, current_depth=0)
+                scan_from(target_id, target_dir)
             else:
                 print(f"⚠️  Target directory '{target_dir}' not found or not accessible")
                 return shared_folders
         else:
             # Start from root
-            root_url = "https://graph.microsoft.com/v1.0/me/drive/root"
-            resp = requests.get(root_url, headers=headers, timeout=30)
+            root_url = f"{GRAPH_BASE_URL}/me/drive/root?$select=id"
+            resp = SESSION.get(root_url, headers=headers, timeout=REQUEST_TIMEOUT)
             
             if resp.status_code == 200:
-                root_data = resp.json()
+                root_data = parse_json_response(resp)
                 root_id = root_data.get('id')
                 
                 print(f"📂 Starting recursive search from root...")
-                check_folder_recursive(root_id, "", current_depth=0)
+                scan_from(root_id, "")
             else:
                 print(f"⚠️  Failed to get root: {resp.status_code}")
                 return shared_folders
     
     except Exception as e:
         print(f"❌ Search error: {e}")
+    finally:
+        progress.clear()
+        if results_file:
+            try:
+                results_file.close()
+            except OSError:
+                pass
+    
+    # Levels are scanned breadth-first; report the results in folder tree order
+    assert len(result_order) == len(shared_folders), "every result needs its tree-order key"
+    ordered = sorted(zip(result_order, range(len(shared_folders))))
+    shared_folders[:] = [shared_folders[position] for _, position in ordered]
     
     # Print level statistics
     print(f"\n📊 Folder count by level:")
@@ -340,6 +631,11 @@ def scan_shared_folders_recursive(access_token: str, max_depth: int = 3, target_
     
     print(f"\n✅ Scan complete. Found {len(shared_folders)} shared folders.")
     print(f"   Checked {len(checked_folders)} total folders recursively.")
+    if unreadable_folders:
+        # Throttling that outlasted the retries, or access denied: do not pass off a partial scan as complete
+        print(f"⚠️  {len(unreadable_folders)} folder(s) could not be read; results may be incomplete:")
+        for path in sorted(set(unreadable_folders)):
+            print(f"   - {path}")
     return shared_folders
 
 def filter_folders_by_user(shared_folders: List[Dict], target_user: str, access_token: str) -> List[Dict]:
@@ -357,63 +653,30 @@ def filter_folders_by_user(shared_folders: List[Dict], target_user: str, access_
     """
     filtered_folders = []
     target_user_lower = target_user.lower()
-    headers = {"Authorization": f"Bearer {access_token}"}
+    headers = auth_headers(access_token)
     
     print(f"🔍 Checking explicit permissions for user: {target_user}")
     
-    for folder in shared_folders:
-        folder_id = folder.get('id')
+    def fetch_permissions(folder: Dict) -> Optional[List[Dict]]:
+        # Get permissions for this specific folder
+        perm_resp = SESSION.get(permissions_list_url(folder.get('id')), headers=headers, timeout=REQUEST_TIMEOUT)
+        if perm_resp.status_code != 200:
+            return None
+        # Follow @odata.nextLink so large ACLs are not truncated to the first page
+        return list(iter_response_items(perm_resp, headers, prefetch=True))
+    
+    # Fetch all permission lists concurrently, then report in the original order
+    with ThreadPoolExecutor(max_workers=MAX_PERMISSION_WORKERS) as executor:
+        futures = [executor.submit(fetch_permissions, folder) for folder in shared_folders]
+    
+    for folder, future in zip(shared_folders, futures):
         folder_path = folder.get('path', '')
         
-        # Check if this folder has explicit permissions for the target user
-        has_explicit_permission = False
-        
         try:
-            # Get permissions for this specific folder
-            permissions_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{folder_id}/permissions"
-            perm_resp = requests.get(permissions_url, headers=headers, timeout=30)
-            
-            if perm_resp.status_code == 200:
-                permissions_data = perm_resp.json()
-                permissions = permissions_data.get("value", [])
-                
-                # Check each permission for the target user
-                for perm in permissions:
-                    # Skip owner permissions
-                    roles = perm.get('roles', [])
-                    if 'owner' in roles:
-                        continue
-                    
-                    # Check if this permission is inherited (has inheritedFrom property)
-                    inherited_from = perm.get('inheritedFrom')
-                    if inherited_from:
-                        # This permission is inherited, skip it
-                        continue
-                    
-                    # Check direct user permissions
-                    granted_to = perm.get('grantedTo')
-                    if granted_to and granted_to.get('user'):
-                        user = granted_to['user']
-                        user_email = user.get('email', '').lower()
-                        if target_user_lower in user_email:
-                            has_explicit_permission = True
-                            break
-                    
-                    # Check grantedToIdentities (OneDrive Business)
-                    granted_to_identities = perm.get('grantedToIdentities', [])
-                    for identity in granted_to_identities:
-                        if identity.get('user'):
-                            user = identity['user']
-                            user_email = user.get('email', '').lower()
-                            if target_user_lower in user_email:
-                                has_explicit_permission = True
-                                break
-                    
-                    if has_explicit_permission:
-                        break
-                
+            permissions = future.result()
+            if permissions is not None:
                 # If no explicit permission found, this folder inherits from parent
-                if has_explicit_permission:
+                if is_explicitly_shared_with(permissions, target_user_lower):
                     filtered_folders.append(folder)
                     print(f"   ✅ Explicit permission: {folder_path}")
                 else:
@@ -426,21 +689,25 @@ def filter_folders_by_user(shared_folders: List[Dict], target_user: str, access_
     
     return filtered_folders
 
-def scan_shared_folders(rclone_remote: Optional[str] = None, max_depth: int = 3, target_dir: Optional[str] = None, only_user: Optional[str] = None, json_output: bool = False) -> None:
+def scan_shared_folders(rclone_remote: Optional[str] = None, max_depth: int = 3, target_dir: Optional[str] = None, only_user: Optional[str] = None, json_output: bool = False,
+                        use_delta: bool = False, check_all: bool = False, output_path: Optional[str] = None) -> None:
     """
     Scan OneDrive for all shared folders by recursively traversing the folder structure up to max_depth.
     When only_user is specified, implements smart pruning to skip subfolders with inherited permissions.
     
     Args:
         rclone_remote: Name of the rclone remote
-        max_depth: Maximum depth to scan (default: 3)
+        max_depth: Maximum depth to scan (default: 3; 0 = no limit)
         target_dir: Optional directory path to scan under
         only_user: Optional email to filter results by user (enables pruning optimization)
         json_output: If True, output detailed JSON instead of formatted text
+        use_delta: If True, take the folder tree from a delta query cached between runs
+        check_all: If True, request permissions even for folders without a 'shared' facet
+        output_path: Optional NDJSON file the shared folders are written to as they are found
     """
     print(f"=== OneDrive Shared Folders Scanner ===")
     print(f"Remote: {rclone_remote}")
-    print(f"Max depth: {max_depth}")
+    print(f"Max depth: {max_depth or 'unlimited'}")
     if target_dir:
         print(f"Target directory: {target_dir}")
     if only_user:
@@ -458,7 +725,14 @@ def scan_shared_folders(rclone_remote: Optional[str] = None, max_depth: int = 3,
     
     # Scan for shared folders
     start_time = time.time()
-    shared_folders = scan_shared_folders_recursive(access_token, max_depth, target_dir, only_user)
+    folder_index = None
+    if use_delta:
+        print("🔄 Updating folder index with a delta query...")
+        folder_index = sync_folder_index(access_token, rclone_remote)
+        if folder_index is None:
+            print("⚠️  Falling back to listing every folder")
+    shared_folders = scan_shared_folders_recursive(access_token, max_depth, target_dir, only_user, folder_index, check_all,
+                                                   output_path)
     scan_time = time.time() - start_time
     
     print()
@@ -478,7 +752,12 @@ def scan_shared_folders(rclone_remote: Optional[str] = None, max_depth: int = 3,
                 "folders": []
             }
             
-            for folder in shared_folders:
+            access_token = refresh_access_token(access_token)
+            detailed_permissions = get_detailed_permissions_bulk(
+                [folder['id'] for folder in shared_folders], access_token
+            )
+            
+            for folder, permissions in zip(shared_folders, detailed_permissions):
                 folder_data = {
                     "path": folder['path'],
                     "name": folder['name'],
@@ -489,7 +768,7 @@ def scan_shared_folders(rclone_remote: Optional[str] = None, max_depth: int = 3,
                     "has_direct_sharing": folder['has_direct_sharing'],
                     "permission_count": folder['permission_count'],
                     "shared_users": folder['shared_users'],
-                    "permissions": get_detailed_permissions(folder['id'], access_token)
+                    "permissions": permissions
                 }
                 output_data["folders"].append(folder_data)
             
@@ -498,19 +777,22 @@ def scan_shared_folders(rclone_remote: Optional[str] = None, max_depth: int = 3,
             print(f"📁 Found {len(shared_folders)} shared folder(s) in {scan_time:.1f} seconds:")
             print("=" * 80)
             
+            # Collect the listing and write it once rather than printing line by line
+            lines = []
             for folder in shared_folders:
-                print(f"{folder['symbol']} {folder['path']}")
-                print(f"   └─ {folder['share_type']} ({folder['permission_count']} permission(s))")
+                lines.append(f"{folder['symbol']} {folder['path']}\n")
+                lines.append(f"   └─ {folder['share_type']} ({folder['permission_count']} permission(s))\n")
                 
                 if folder['shared_users']:
                     users_str = ', '.join(folder['shared_users'][:3])
                     if len(folder['shared_users']) > 3:
                         users_str += f" and {len(folder['shared_users']) - 3} more"
-                    print(f"   └─ Shared with: {users_str}")
+                    lines.append(f"   └─ Shared with: {users_str}\n")
                 
                 if folder['has_link_sharing'] and folder['has_direct_sharing']:
-                    print(f"   └─ Has both link sharing and direct permissions")
-                print()
+                    lines.append("   └─ Has both link sharing and direct permissions\n")
+                lines.append("\n")
+            sys.stdout.write("".join(lines))
     else:
         print(f"ℹ️  No shared folders found in {scan_time:.1f} seconds")
         if only_user:
@@ -528,16 +810,15 @@ def scan_shared_folders(rclone_remote: Optional[str] = None, max_depth: int = 3,
 
 def get_detailed_permissions(folder_id: str, access_token: str) -> List[Dict]:
     """Get detailed permissions for a folder including explicit vs inherited status."""
-    headers = {"Authorization": f"Bearer {access_token}"}
+    headers = auth_headers(access_token)
     detailed_permissions = []
     
     try:
-        permissions_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{folder_id}/permissions"
-        perm_resp = requests.get(permissions_url, headers=headers, timeout=30)
+        perm_resp = SESSION.get(permissions_list_url(folder_id), headers=headers, timeout=REQUEST_TIMEOUT)
         
         if perm_resp.status_code == 200:
-            permissions_data = perm_resp.json()
-            permissions = permissions_data.get("value", [])
+            # Follow @odata.nextLink so large ACLs are not truncated to the first page
+            permissions = list(iter_response_items(perm_resp, headers, prefetch=True))
             
             for perm in permissions:
                 perm_detail = {
@@ -556,21 +837,57 @@ def get_detailed_permissions(folder_id: str, access_token: str) -> List[Dict]:
     
     return detailed_permissions
 
+def get_detailed_permissions_bulk(folder_ids: List[str], access_token: str,
+                                  max_workers: int = MAX_PERMISSION_WORKERS) -> List[List[Dict]]:
+    """
+    Get detailed permissions for several folders, fetching them concurrently.
+    
+    Requests share SESSION's pooled connections, whose transport retries
+    already honour Retry-After on 429/503 for these GETs.
+    
+    Args:
+        folder_ids: IDs of the folders to inspect
+        access_token: OAuth access token for Graph API
+        max_workers: Maximum number of permission requests in flight at once
+    
+    Returns:
+        Detailed permissions per folder, in the same order as folder_ids
+    """
+    if len(folder_ids) <= 1:
+        return [get_detailed_permissions(folder_id, access_token) for folder_id in folder_ids]
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(folder_ids))) as executor:
+        return list(executor.map(lambda folder_id: get_detailed_permissions(folder_id, access_token), folder_ids))
+
 def main():
     """Main function"""
     parser = argparse.ArgumentParser(description="Scan OneDrive for shared folders")
     parser.add_argument("--remote", default=None, 
                        help="Name of the OneDrive remote (default: auto-detect)")
     parser.add_argument("--max-depth", type=int, default=3,
-                       help="Maximum depth to scan (default: 3)")
+                       help="Maximum depth to scan (default: 3, 0 = unlimited)")
     parser.add_argument("--only-user", 
                        help="Filter to show only folders with explicit permissions for specific user (enables pruning optimization)")
     parser.add_argument("--json-output", action="store_true",
                        help="Output results in JSON format for debugging")
+    parser.add_argument("--delta", action="store_true",
+                       help="Enumerate folders with a delta query cached between runs; later scans only download changes")
+    parser.add_argument("--force-check-all", action="store_true",
+                       help="Request permissions of every folder, not only those Graph marks as shared")
+    parser.add_argument("--output", metavar="FILE",
+                       help="Also write each shared folder to FILE as one JSON line (NDJSON) as soon as it is found")
+    parser.add_argument("--qps", type=float, default=DEFAULT_QPS,
+                       help=f"Maximum Graph HTTP requests per second, a $batch call counting once (default: {DEFAULT_QPS:g}, 0 = unlimited)")
     parser.add_argument("dirname", nargs="?", 
                        help="Optional: scan only under this directory path")
     
     args = parser.parse_args()
+    if args.max_depth < 0:
+        parser.error("--max-depth must be 0 (unlimited) or a positive number")
+    set_request_rate(args.qps)
+    
+    # Connect to Graph while the token is read from rclone.conf
+    prewarm_session()
     
     print("OneDrive Shared Folders Scanner")
     print("=" * 50)
@@ -579,16 +896,9 @@ def main():
     if args.max_depth == 3:
         print("Using max depth: 3")
     
-    # Check if requests is available
-    try:
-        import requests
-    except ImportError:
-        print("❌ requests library not found")
-        print("Please install it: pip install requests")
-        return
-    
     # Execute the scan
-    scan_shared_folders(args.remote, args.max_depth, args.dirname, args.only_user, args.json_output)
+    scan_shared_folders(args.remote, args.max_depth, args.dirname, args.only_user, args.json_output, args.delta,
+                        args.force_check_all, args.output)
 
 if __name__ == "__main__":
     main()
@@ -7,13 +7,136 @@ This module provides shared functions for:
 - Extracting access tokens
 - Finding OneDrive remotes
 - Prompting for configuration when needed
+- Reading and writing small JSON caches under ~/.cache/onedriveguard
 """
 
-import configparser
 import json
 import os
+import time
+from functools import lru_cache
 from datetime import datetime, timezone
-from typing import Optional, List, Tuple
+from typing import TYPE_CHECKING, Dict, Optional, List, Tuple
+
+if TYPE_CHECKING:
+    import configparser
+
+CACHE_DIR = os.path.expanduser("~/.cache/onedriveguard")
+
+# Parsed rclone.conf keyed by (path, mtime in ns) so the file is re-read only when it changes
+_CONF_CACHE: Dict[Tuple[str, int], 'configparser.RawConfigParser'] = {}
+
+# rclone backend types that are OneDrive remotes
+ONEDRIVE_TYPES = frozenset({'onedrive', 'onedrivebusiness', 'sharepoint'})
+
+# Remote name -> (access token, expiry on the time.monotonic() clock)
+_TOKEN_CACHE: Dict[str, Tuple[str, float]] = {}
+
+# Seconds before expiry at which a cached token is no longer handed out
+TOKEN_EXPIRY_MARGIN = 60
+
+# Remaining token lifetime (seconds) below which a long scan may outlive the token
+TOKEN_LOW_LIFETIME = 600
+
+# Remotes whose token rclone has already been asked to refresh in this process
+_REFRESHED_REMOTES = set()
+
+# Access token -> time.monotonic() of the last attempt to refresh it mid-run
+_REFRESH_ATTEMPTS: Dict[str, float] = {}
+
+def _load_config(conf_path: str) -> Optional['configparser.RawConfigParser']:
+    """
+    Parse rclone.conf, reusing the previous parse while the file is unchanged.
+    
+    A RawConfigParser is used because rclone values (tokens, passwords) are
+    literal: '%' in them must not be treated as interpolation syntax.
+    
+    Args:
+        conf_path: Path to rclone.conf
+        
+    Returns:
+        Parsed configuration, or None if the file does not exist
+    """
+    try:
+        key = (conf_path, os.stat(conf_path).st_mtime_ns)
+        config = _CONF_CACHE.get(key)
+        if config is None:
+            # Imported here so commands that never read rclone.conf (e.g. --help) skip it
+            import configparser
+            config = configparser.RawConfigParser()
+            with open(conf_path) as f:
+                config.read_file(f)
+            # Drop parses of older versions of the file
+            _CONF_CACHE.clear()
+            _CONF_CACHE[key] = config
+    except FileNotFoundError:
+        return None
+    return config
+
+@lru_cache(maxsize=16)
+def _decode_token(token_json: str) -> Dict:
+    """
+    Decode a remote's token JSON, reusing the result for an unchanged string.
+    
+    The returned dict is shared between callers and must not be modified.
+    
+    Raises:
+        ValueError: If token_json is not valid JSON
+    """
+    return json.loads(token_json)
+
+def _remote_token(config: 'configparser.RawConfigParser', rclone_remote: str, conf_path: str) -> Optional[Dict]:
+    """Read and decode a remote's token from the parsed config, printing why on failure."""
+    token_json = config.get(rclone_remote, "token", fallback=None)
+    if not token_json:
+        print(f"Error: No token found for remote '{rclone_remote}' in {conf_path}")
+        print("Please authenticate first: rclone authorize onedrive")
+        return None
+    
+    try:
+        return _decode_token(token_json)
+    except Exception as e:
+        print(f"Error: Could not parse token JSON: {e}")
+        return None
+
+def _expires_within(token: Dict, seconds: float) -> bool:
+    """True if the token's expiry is known and less than `seconds` away (or past)."""
+    try:
+        expiry_time = datetime.fromisoformat(token.get("expiry", ""))
+    except ValueError:
+        return False
+    if expiry_time.tzinfo is None:
+        expiry_time = expiry_time.replace(tzinfo=timezone.utc)
+    return (expiry_time - datetime.now(timezone.utc)).total_seconds() < seconds
+
+def _refresh_token_with_rclone(rclone_remote: str) -> bool:
+    """
+    Have rclone refresh a remote's token by running a cheap command against it.
+    
+    rclone refreshes an expiring token before any request and writes the new
+    one back to rclone.conf, so the config just has to be read again.
+    
+    Returns:
+        True if rclone ran successfully, False if it is missing or failed
+    """
+    # Imported here: only needed on the rare run that finds an expiring token
+    import shutil
+    import subprocess
+    
+    rclone = shutil.which("rclone")
+    if rclone is None:
+        return False
+    
+    print(f"🔄 Token for '{rclone_remote}' has expired or is about to; refreshing it with: rclone about {rclone_remote}:")
+    try:
+        result = subprocess.run([rclone, "about", f"{rclone_remote}:"], capture_output=True, text=True, timeout=60)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"⚠️  Could not run rclone to refresh the token: {e}")
+        return False
+    
+    if result.returncode != 0:
+        print(f"⚠️  rclone could not refresh the token: {result.stderr.strip()}")
+        return False
+    return True
 
 def find_onedrive_remotes() -> List[str]:
     """
@@ -23,26 +146,17 @@ def find_onedrive_remotes() -> List[str]:
         List of OneDrive remote names
     """
     conf_path = os.path.expanduser("~/.config/rclone/rclone.conf")
-    if not os.path.exists(conf_path):
+    config = _load_config(conf_path)
+    if config is None:
         return []
     
-    config = configparser.ConfigParser()
-    config.read(conf_path)
-    
-    onedrive_remotes = []
-    for section_name in config.sections():
-        if section_name.startswith('[') and section_name.endswith(']'):
-            # Skip section headers
-            continue
-        
-        section = config[section_name]
-        remote_type = section.get('type', '').lower()
-        
-        # Check for OneDrive types
-        if remote_type in ['onedrive', 'onedrivebusiness', 'sharepoint']:
-            onedrive_remotes.append(section_name)
-    
-    return onedrive_remotes
+    # config.get() reads the option directly, without building a SectionProxy per section
+    return [
+        section_name for section_name in config.sections()
+        # Skip section headers
+        if not (section_name.startswith('[') and section_name.endswith(']'))
+        and config.get(section_name, 'type', fallback='').lower() in ONEDRIVE_TYPES
+    ]
 
 def get_access_token(rclone_remote: Optional[str] = None) -> Optional[str]:
     """
@@ -55,15 +169,19 @@ def get_access_token(rclone_remote: Optional[str] = None) -> Optional[str]:
     Returns:
         Access token string if successful, None otherwise
     """
+    # Reuse a token already extracted for this remote until shortly before it expires
+    if rclone_remote is not None:
+        cached_token, expires_at = _TOKEN_CACHE.get(rclone_remote, (None, 0.0))
+        if cached_token and time.monotonic() < expires_at - TOKEN_EXPIRY_MARGIN:
+            return cached_token
+    
     conf_path = os.path.expanduser("~/.config/rclone/rclone.conf")
-    if not os.path.exists(conf_path):
+    config = _load_config(conf_path)
+    if config is None:
         print(f"Error: rclone config not found at {conf_path}")
         print("Please configure rclone first: rclone config")
         return None
     
-    config = configparser.ConfigParser()
-    config.read(conf_path)
-    
     # If no remote specified, find OneDrive remotes and prompt
     if rclone_remote is None:
         onedrive_remotes = find_onedrive_remotes()
@@ -86,25 +204,28 @@ def get_access_token(rclone_remote: Optional[str] = None) -> Optional[str]:
             rclone_remote = onedrive_remotes[0]
             print(f"Using first OneDrive remote: {rclone_remote}")
     
+    # A dict lookup on the parsed sections; an unknown remote fails here, before any Graph call
     if rclone_remote not in config:
         print(f"Error: Remote '{rclone_remote}' not found in {conf_path}")
         print(f"Available remotes: {list(config.sections())}")
         return None
     
-    section = config[rclone_remote]
-    token_json = section.get("token")
-    if not token_json:
-        print(f"Error: No token found for remote '{rclone_remote}' in {conf_path}")
-        print("Please authenticate first: rclone authorize onedrive")
+    token = _remote_token(config, rclone_remote, conf_path)
+    if token is None:
         return None
     
-    try:
-        token = json.loads(token_json)
-    except Exception as e:
-        print(f"Error: Could not parse token JSON: {e}")
-        return None
+    # Refresh a token that is expired or about to expire before using it, rather than
+    # finding out from a 401; once per remote, in case rclone keeps the same token
+    if rclone_remote not in _REFRESHED_REMOTES and _expires_within(token, TOKEN_EXPIRY_MARGIN):
+        _REFRESHED_REMOTES.add(rclone_remote)
+        if _refresh_token_with_rclone(rclone_remote):
+            config = _load_config(conf_path)
+            token = _remote_token(config, rclone_remote, conf_path) if config is not None else None
+            if token is None:
+                return None
     
     # Check if token is expired
+    expires_at = None
     expiry_str = token.get("expiry")
     if expiry_str:
         try:
@@ -128,6 +249,12 @@ def get_access_token(rclone_remote: Optional[str] = None) -> Optional[str]:
                 print("Or re-authenticate completely:")
                 print(f"   rclone config")
                 return None
+            
+            remaining = (expiry_time_utc - current_time).total_seconds()
+            expires_at = time.monotonic() + remaining
+            if remaining < TOKEN_LOW_LIFETIME:
+                print(f"⚠️  Token expires in {int(remaining // 60)} minute(s); long scans may fail part-way")
+                print(f"   Refresh it first with: rclone about {rclone_remote}:")
                 
         except ValueError as e:
             print(f"Warning: Could not parse token expiry time '{expiry_str}': {e}")
@@ -139,6 +266,45 @@ def get_access_token(rclone_remote: Optional[str] = None) -> Optional[str]:
         print("Token may be expired. Please re-authenticate: rclone authorize onedrive")
         return None
     
+    if expires_at is not None:
+        _TOKEN_CACHE[rclone_remote] = (access_token, expires_at)
+    
+    return access_token
+
+def refresh_access_token(access_token: str) -> str:
+    """
+    Keep the token of a long-running job valid, refreshing it shortly before it expires.
+    
+    Meant to be called between steps of a job that may outlive its token (a full
+    scan can take longer than the usual one-hour lifetime). rclone is asked to
+    refresh at most once a minute per token.
+    
+    Args:
+        access_token: Token previously returned by get_access_token
+        
+    Returns:
+        A fresh token for the same remote if access_token was about to expire and could
+        be refreshed; otherwise access_token itself
+    """
+    for rclone_remote, (cached_token, expires_at) in list(_TOKEN_CACHE.items()):
+        if cached_token != access_token:
+            continue
+        
+        now = time.monotonic()
+        if now < expires_at - TOKEN_EXPIRY_MARGIN:
+            return access_token
+        if now - _REFRESH_ATTEMPTS.get(access_token, float('-inf')) < TOKEN_EXPIRY_MARGIN:
+            return access_token
+        _REFRESH_ATTEMPTS[access_token] = now
+        
+        if not _refresh_token_with_rclone(rclone_remote):
+            return access_token
+        # Read the token rclone wrote back; it has just been refreshed, so do not ask again
+        _TOKEN_CACHE.pop(rclone_remote, None)
+        _REFRESHED_REMOTES.add(rclone_remote)
+        return get_access_token(rclone_remote) or access_token
+    
+    # Tokens without a known expiry are not cached, and cannot be refreshed either
     return access_token
 
 def validate_remote_config(rclone_remote: str) -> bool:
@@ -152,12 +318,10 @@ def validate_remote_config(rclone_remote: str) -> bool:
         True if remote is valid, False otherwise
     """
     conf_path = os.path.expanduser("~/.config/rclone/rclone.conf")
-    if not os.path.exists(conf_path):
+    config = _load_config(conf_path)
+    if config is None:
         return False
     
-    config = configparser.ConfigParser()
-    config.read(conf_path)
-    
     if rclone_remote not in config:
         return False
     
@@ -167,7 +331,44 @@ def validate_remote_config(rclone_remote: str) -> bool:
         return False
     
     try:
-        token = json.loads(token_json)
+        token = _decode_token(token_json)
         return bool(token.get("access_token"))
     except Exception:
-        return False 
\ No newline at end of file
+        return False
+
+def load_json_cache(name: str) -> Dict:
+    """
+    Load a JSON cache file from CACHE_DIR.
+    
+    Args:
+        name: File name inside CACHE_DIR
+        
+    Returns:
+        Cached data, or an empty dict if the file is missing or unreadable
+    """
+    try:
+        with open(os.path.join(CACHE_DIR, name)) as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def save_json_cache(name: str, data: Dict) -> None:
+    """
+    Write a JSON cache file to CACHE_DIR, replacing it atomically.
+    
+    Caches are best-effort: failures to write are ignored.
+    
+    Args:
+        name: File name inside CACHE_DIR
+        data: JSON-serialisable data to store
+    """
+    path = os.path.join(CACHE_DIR, name)
+    tmp_path = f"{path}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
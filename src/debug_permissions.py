@@ -1,13 +1,19 @@
 #!/usr/bin/env python3
 """
 Debug script to test permission detection for a specific folder
+
+Run from the repository root with: python -m src.debug_permissions
 """
 
 import requests
 import json
 import configparser
 import os
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+from .graph_utils import GRAPH_BASE_URL, SESSION, item_path_endpoint, iter_response_items, parse_json_response
+
+# Only the permission fields these checks read, to keep responses small
+PERMISSION_SELECT = "$select=id,roles,grantedTo,grantedToIdentities,inheritedFrom,link"
 
 def get_access_token(rclone_remote: str = "OneDrive") -> Optional[str]:
     """Extract access token from rclone.conf for the specified remote."""
@@ -16,7 +22,7 @@ def get_access_token(rclone_remote: str = "OneDrive") -> Optional[str]:
         print(f"Error: rclone config not found at {conf_path}")
         return None
     
-    config = configparser.ConfigParser()
+    config = configparser.RawConfigParser()
     config.read(conf_path)
     
     if rclone_remote not in config:
@@ -42,6 +48,42 @@ def get_access_token(rclone_remote: str = "OneDrive") -> Optional[str]:
     
     return access_token
 
+def get_folder_and_permissions(folder_path: str, headers: Dict) -> Tuple[Optional[Dict], Optional[List[Dict]]]:
+    """
+    Fetch a folder and its permissions in one HTTP round trip via Graph $batch.
+    
+    Both sub-requests address the folder by path ("/root:/<path>" and
+    "/root:/<path>:/permissions"), so neither has to wait for the folder ID.
+    Failures are printed; the failed half is returned as None.
+    """
+    item_endpoint = item_path_endpoint(folder_path)
+    batch = {"requests": [
+        {"id": "folder", "method": "GET", "url": f"{item_endpoint}?$select=id,name"},
+        {"id": "permissions", "method": "GET", "url": f"{item_endpoint}:/permissions?{PERMISSION_SELECT}"}
+    ]}
+    resp = SESSION.post(f"{GRAPH_BASE_URL}/$batch", headers={**headers, "Content-Type": "application/json"},
+                         json=batch, timeout=30)
+    if resp.status_code != 200:
+        print(f"❌ Batch request failed: {resp.status_code}")
+        print(resp.text)
+        return None, None
+    
+    responses = {r.get('id'): r for r in parse_json_response(resp).get('responses', [])}
+    
+    folder = responses.get('folder', {})
+    folder_data = folder.get('body') if folder.get('status') == 200 else None
+    if folder_data is None:
+        print(f"❌ Failed to get folder: {folder.get('status')}")
+        print(json.dumps(folder.get('body')))
+    
+    perms = responses.get('permissions', {})
+    permissions = perms.get('body', {}).get("value", []) if perms.get('status') == 200 else None
+    if folder_data is not None and permissions is None:
+        print(f"❌ Failed to get permissions: {perms.get('status')}")
+        print(json.dumps(perms.get('body')))
+    
+    return folder_data, permissions
+
 def debug_folder_permissions(folder_path: str, target_user: str):
     """Debug permissions for a specific folder"""
     access_token = get_access_token()
@@ -56,34 +98,20 @@ def debug_folder_permissions(folder_path: str, target_user: str):
     print(f"🔍 Looking for user: {target_user}")
     print()
     
-    # Get the folder by path
-    folder_url = f"https://graph.microsoft.com/v1.0/me/drive/root:/{folder_path}"
-    resp = requests.get(folder_url, headers=headers, timeout=30)
-    
-    if resp.status_code != 200:
-        print(f"❌ Failed to get folder: {resp.status_code}")
-        print(resp.text)
+    # Get the folder and its permissions together
+    folder_data, permissions = get_folder_and_permissions(folder_path, headers)
+    if folder_data is None:
         return
     
-    folder_data = resp.json()
     folder_id = folder_data.get('id')
     folder_name = folder_data.get('name')
     
     print(f"✅ Found folder: {folder_name} (ID: {folder_id})")
     print()
     
-    # Get permissions for this folder
-    permissions_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{folder_id}/permissions"
-    perm_resp = requests.get(permissions_url, headers=headers, timeout=30)
-    
-    if perm_resp.status_code != 200:
-        print(f"❌ Failed to get permissions: {perm_resp.status_code}")
-        print(perm_resp.text)
+    if permissions is None:
         return
     
-    permissions_data = perm_resp.json()
-    permissions = permissions_data.get("value", [])
-    
     print(f"📋 Found {len(permissions)} permission(s):")
     print()
     
@@ -149,26 +177,26 @@ def test_folder_id_mismatch():
     print()
     
     # Method 1: Get by path (like in debug script)
-    folder_url = f"https://graph.microsoft.com/v1.0/me/drive/root:/{folder_path}"
-    resp = requests.get(folder_url, headers=headers, timeout=30)
+    folder_url = f"{GRAPH_BASE_URL}{item_path_endpoint(folder_path)}?$select=id"
+    resp = SESSION.get(folder_url, headers=headers, timeout=30)
     
     if resp.status_code != 200:
         print(f"❌ Failed to get folder by path: {resp.status_code}")
         return
     
-    folder_data = resp.json()
+    folder_data = parse_json_response(resp)
     folder_id_by_path = folder_data.get('id')
     print(f"✅ Folder ID by path: {folder_id_by_path}")
     
     # Method 2: Get by ID (like in main script)
-    folder_info_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{folder_id_by_path}"
-    info_resp = requests.get(folder_info_url, headers=headers, timeout=30)
+    folder_info_url = f"{GRAPH_BASE_URL}/me/drive/items/{folder_id_by_path}?$select=id"
+    info_resp = SESSION.get(folder_info_url, headers=headers, timeout=30)
     
     if info_resp.status_code != 200:
         print(f"❌ Failed to get folder by ID: {info_resp.status_code}")
         return
     
-    folder_info_data = info_resp.json()
+    folder_info_data = parse_json_response(info_resp)
     folder_id_by_id = folder_info_data.get('id')
     print(f"✅ Folder ID by ID: {folder_id_by_id}")
     
@@ -196,30 +224,16 @@ def test_main_script_logic():
     # Simulate the folder data that would be in shared_folders list
     folder_path = "🇦🇺 Colourful.land Pty Ltd (Business Name = Historic Rivermill)"
     
-    # Get folder ID like the main script does
-    folder_url = f"https://graph.microsoft.com/v1.0/me/drive/root:/{folder_path}"
-    resp = requests.get(folder_url, headers=headers, timeout=30)
-    
-    if resp.status_code != 200:
-        print(f"❌ Failed to get folder: {resp.status_code}")
-        return
-    
-    folder_data = resp.json()
-    folder_id = folder_data.get('id')
-    
-    print(f"✅ Using folder ID: {folder_id}")
-    print()
-    
     # Now test the exact filtering logic
     has_explicit_permission = False
     
     try:
-        # Get permissions for this specific folder
-        permissions_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{folder_id}/permissions"
-        perm_resp = requests.get(permissions_url, headers=headers, timeout=30)
+        # Get permissions for this specific folder, addressed by path (no ID lookup needed)
+        permissions_url = f"{GRAPH_BASE_URL}{item_path_endpoint(folder_path)}:/permissions?{PERMISSION_SELECT}"
+        perm_resp = SESSION.get(permissions_url, headers=headers, timeout=30)
         
         if perm_resp.status_code == 200:
-            permissions_data = perm_resp.json()
+            permissions_data = parse_json_response(perm_resp)
             permissions = permissions_data.get("value", [])
             
             print(f"📋 Found {len(permissions)} permission(s):")
@@ -292,31 +306,20 @@ def test_initial_scan_discovery():
     print(f"🔍 Looking for folder: {target_folder_path}")
     print()
     
-    # Get the folder by path first
-    folder_url = f"https://graph.microsoft.com/v1.0/me/drive/root:/{target_folder_path}"
-    resp = requests.get(folder_url, headers=headers, timeout=30)
-    
-    if resp.status_code != 200:
-        print(f"❌ Failed to get folder by path: {resp.status_code}")
+    # Get the folder by path, and its permissions in the same round trip
+    folder_data, permissions = get_folder_and_permissions(target_folder_path, headers)
+    if folder_data is None:
         return
     
-    folder_data = resp.json()
     folder_id = folder_data.get('id')
     
     print(f"✅ Target folder ID: {folder_id}")
     print()
     
     # Now simulate the initial scan logic - check permissions for this folder
-    permissions_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{folder_id}/permissions"
-    perm_resp = requests.get(permissions_url, headers=headers, timeout=30)
-    
-    if perm_resp.status_code != 200:
-        print(f"❌ Failed to get permissions: {perm_resp.status_code}")
+    if permissions is None:
         return
     
-    permissions_data = perm_resp.json()
-    permissions = permissions_data.get("value", [])
-    
     print(f"📋 Found {len(permissions)} permission(s) during initial scan:")
     print()
     
@@ -382,39 +385,42 @@ def test_recursive_vs_path_id_mismatch():
     print()
     
     # Method 1: Get by path (like when scanning specific folder)
-    folder_url = f"https://graph.microsoft.com/v1.0/me/drive/root:/{target_folder_path}"
-    resp = requests.get(folder_url, headers=headers, timeout=30)
+    folder_url = f"{GRAPH_BASE_URL}{item_path_endpoint(target_folder_path)}?$select=id"
+    resp = SESSION.get(folder_url, headers=headers, timeout=30)
     
     if resp.status_code != 200:
         print(f"❌ Failed to get folder by path: {resp.status_code}")
         return
     
-    folder_data = resp.json()
+    folder_data = parse_json_response(resp)
     folder_id_by_path = folder_data.get('id')
     print(f"✅ Folder ID by path: {folder_id_by_path}")
     
     # Method 2: Simulate recursive scan - get root, then find this folder in children
-    root_url = "https://graph.microsoft.com/v1.0/me/drive/root"
-    root_resp = requests.get(root_url, headers=headers, timeout=30)
+    root_url = f"{GRAPH_BASE_URL}/me/drive/root?$select=id"
+    root_resp = SESSION.get(root_url, headers=headers, timeout=30)
     
     if root_resp.status_code != 200:
         print(f"❌ Failed to get root: {root_resp.status_code}")
         return
     
-    root_data = root_resp.json()
+    root_data = parse_json_response(root_resp)
     root_id = root_data.get('id')
     print(f"✅ Root ID: {root_id}")
     
-    # Get children of root
-    children_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{root_id}/children"
-    children_resp = requests.get(children_url, headers=headers, timeout=30)
+    # Get children of root, following @odata.nextLink so large folders are listed in full
+    children_url = f"{GRAPH_BASE_URL}/me/drive/items/{root_id}/children?$select=id,name,folder"
+    children_resp = SESSION.get(children_url, headers=headers, timeout=30)
     
     if children_resp.status_code != 200:
         print(f"❌ Failed to get children: {children_resp.status_code}")
         return
     
-    children_data = children_resp.json()
-    children = children_data.get("value", [])
+    try:
+        children = list(iter_response_items(children_resp, headers, prefetch=True))
+    except requests.exceptions.HTTPError as e:
+        print(f"❌ Failed to get children: {e}")
+        return
     
     print(f"📋 Found {len(children)} children in root:")
     for child in children:
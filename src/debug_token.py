@@ -21,7 +21,7 @@ def examine_rclone_token(rclone_remote: str = "OneDrive-ACL"):
         print(f"❌ Config file not found: {conf_path}")
         return
     
-    config = configparser.ConfigParser()
+    config = configparser.RawConfigParser()
     config.read(conf_path)
     
     if rclone_remote not in config:
@@ -86,7 +86,7 @@ def test_different_token_fields():
     if not os.path.exists(conf_path):
         return
     
-    config = configparser.ConfigParser()
+    config = configparser.RawConfigParser()
     config.read(conf_path)
     
     if rclone_remote not in config:
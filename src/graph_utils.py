@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Shared Microsoft Graph utilities for OneDrive ACL management tools.
+
+This module provides shared functions for:
+- Building Microsoft Graph API URLs
+- Sharing one pooled HTTP session (keep-alive, transport retries) across all calls
+- Pacing requests client-side so Graph's throttling limits are not hit in the first place
+- Combining several Graph calls into one HTTP round trip via JSON batching
+- Fast JSON encoding/decoding with orjson when it is installed
+- Iterating paged collections lazily, streaming items with ijson when it is installed
+"""
+
+import atexit
+import json
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    # Optional: orjson parses Graph payloads several times faster than stdlib json
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    # Optional: ijson parses collection entries incrementally off the socket
+    ijson = None
+
+GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0"
+
+# (connect, read) seconds: fail fast on unreachable hosts, but give large
+# listings and $batch responses time to arrive
+REQUEST_TIMEOUT = (10, 300)
+
+# Microsoft Graph accepts at most 20 sub-requests per $batch call
+BATCH_LIMIT = 20
+
+# Upper bound on $batch calls in flight at once (kept below the session pool size)
+MAX_WORKERS = 8
+
+# Keep-alive connections SESSION holds open. requests speaks HTTP/1.1, so each
+# request in flight needs a connection of its own: this covers MAX_WORKERS
+# $batch chunks plus as many page prefetches without opening throwaway sockets
+POOL_SIZE = 2 * MAX_WORKERS + 4
+
+# Times throttled sub-requests are re-submitted before their status is returned
+BATCH_THROTTLE_RETRIES = 3
+
+# Sub-response statuses meaning "not processed, try again later"
+BATCH_RETRY_STATUSES = frozenset({429, 503})
+
+# Base wait when a throttled sub-response carries no Retry-After header; doubled per attempt
+DEFAULT_RETRY_AFTER = 2.0
+
+# Default request rate (HTTP requests per second; a $batch call counts once): Graph
+# throttles OneDrive at roughly 1200 requests per minute per app and user
+DEFAULT_QPS = 20.0
+
+# Requests that may be sent back to back before pacing sets in
+RATE_BURST = 60
+
+
+# Fields the ACL tools read from a permission; requesting only these shrinks the payload
+PERMISSION_FIELDS = "id,roles,grantedTo,grantedToIdentities,inheritedFrom,hasPassword,expirationDateTime,link"
+
+# Fields needed to resolve a path to an item and describe it
+ITEM_FIELDS = "id,name,folder,file"
+
+
+@lru_cache(maxsize=256)
+def item_path_endpoint(item_path: str) -> str:
+    """
+    Build the Graph endpoint (relative to GRAPH_BASE_URL) addressing an item by path.
+    
+    The path is percent-encoded so names with spaces, '#', '%' or non-ASCII
+    characters resolve instead of failing or being redirected.
+    
+    Args:
+        item_path: Path to the folder or file in OneDrive, e.g. "Documents/My Project"
+        
+    Returns:
+        Endpoint such as "/me/drive/root:/Documents/My%20Project"
+    """
+    return f"/me/drive/root:/{quote(item_path, safe='/')}"
+
+
+@lru_cache(maxsize=1024)
+def permissions_url(item_id: str) -> str:
+    """Build the full URL of an item's permissions collection."""
+    return f"{GRAPH_BASE_URL}/me/drive/items/{item_id}/permissions"
+
+
+@lru_cache(maxsize=1024)
+def permissions_list_url(item_id: str) -> str:
+    """Build the URL listing an item's permissions, selecting only PERMISSION_FIELDS."""
+    return f"{permissions_url(item_id)}?$select={PERMISSION_FIELDS}"
+
+
+@lru_cache(maxsize=8)
+def auth_headers(access_token: str) -> Dict[str, str]:
+    """
+    Build the Authorization header dict for a token, once per token.
+    
+    The dict is shared between callers: copy it (e.g. {**headers, ...}) to add headers.
+    """
+    return {"Authorization": f"Bearer {access_token}"}
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: allows bursts of up to `burst` requests, then `rate` per second.
+    
+    A rate of 0 or less disables pacing.
+    """
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def set_rate(self, rate: float) -> None:
+        """Change the sustained rate (requests per second); 0 or less disables pacing."""
+        with self._lock:
+            self.rate = rate
+    
+    def acquire(self) -> None:
+        """Take one token from the bucket, sleeping until it has been refilled if needed."""
+        with self._lock:
+            if self.rate <= 0:
+                return
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # Reserve the token now, even if that overdraws the bucket, so that
+            # concurrent callers queue up behind each other instead of all waking at once
+            self._tokens -= 1
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+# Shared by every Graph request sent through SESSION
+RATE_LIMITER = RateLimiter(DEFAULT_QPS, RATE_BURST)
+
+
+def set_request_rate(qps: float) -> None:
+    """Set the client-side Graph request rate in requests per second (0 disables pacing)."""
+    RATE_LIMITER.set_rate(qps)
+
+
+class _RateLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter that takes a RATE_LIMITER token before each request it sends."""
+    
+    def send(self, request, **kwargs):
+        RATE_LIMITER.acquire()
+        return super().send(request, **kwargs)
+
+
+def _create_session() -> requests.Session:
+    """Create a session that keeps connections to Graph alive between calls."""
+    session = requests.Session()
+    # Retry throttling and transient server errors, honouring Retry-After; idempotent
+    # methods only, so a POST (invite, $batch) is never sent twice. Let the caller's
+    # status handling see the final response once retries run out.
+    retries = Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    session.mount("https://", _RateLimitedAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retries))
+    return session
+
+
+# Shared by every Graph call so each run pays for one TCP+TLS handshake, not one per request
+SESSION = _create_session()
+atexit.register(SESSION.close)
+
+# Fetches the next page of a collection while the caller is still consuming the current one
+_PAGE_PREFETCHER = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="graph-prefetch")
+
+
+def prewarm_session() -> None:
+    """
+    Open a connection to Graph in the background while the caller does local work.
+    
+    The TCP+TLS handshake overlaps with reading rclone.conf, and the connection
+    is left in SESSION's pool for the first real request. Failures are ignored:
+    the real request simply opens its own connection.
+    """
+    def warm():
+        try:
+            SESSION.head(f"{GRAPH_BASE_URL}/$metadata", timeout=10).close()
+        except requests.exceptions.RequestException:
+            pass
+    
+    threading.Thread(target=warm, daemon=True).start()
+
+
+def parse_json_response(resp: requests.Response) -> Any:
+    """Decode a JSON response body, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(resp.content)
+    return resp.json()
+
+
+def dump_json(data: Any) -> bytes:
+    """Encode a request body as UTF-8 JSON, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def _iter_page_items(resp: requests.Response, streamed: bool,
+                     on_next_link: Optional[Callable[[str], None]] = None) -> Iterator[Dict]:
+    """
+    Yield the entries of one page's 'value' array and return its @odata.nextLink.
+    
+    With ijson installed and a streamed response (streamed=True: requested with
+    stream=True, body not read yet), entries are built one at a time from the
+    parser events as the body arrives; otherwise the page is decoded whole.
+    on_next_link, if given, is called with the next link as soon as it is parsed.
+    """
+    if ijson is None or not streamed:
+        page = parse_json_response(resp)
+        next_link = page.get('@odata.nextLink')
+        if next_link and on_next_link is not None:
+            on_next_link(next_link)
+        yield from page.get('value', [])
+        return next_link
+
+    next_link = None
+    builder = None
+    resp.raw.decode_content = True
+    for prefix, event, value in ijson.parse(resp.raw, use_float=True):
+        if prefix == 'value.item' and event in ('start_map', 'start_array'):
+            builder = ijson.ObjectBuilder()
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == 'value.item' and event in ('end_map', 'end_array'):
+                yield builder.value
+                builder = None
+        elif prefix == '@odata.nextLink':
+            next_link = value
+            if on_next_link is not None:
+                on_next_link(next_link)
+    return next_link
+
+
+def _get_page(url: str, headers: Dict) -> requests.Response:
+    """GET a follow-up page of a collection, streamed; raise HTTPError unless it is a 200."""
+    resp = SESSION.get(url, headers=headers, timeout=REQUEST_TIMEOUT, stream=True)
+    if resp.status_code != 200:
+        resp.close()
+        resp.raise_for_status()
+    return resp
+
+
+def _close_prefetched_page(future: Future) -> None:
+    """Close a prefetched page nobody is going to read."""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def iter_response_items(resp: requests.Response, headers: Dict, prefetch: bool = False,
+                        stream: bool = False) -> Iterator[Dict]:
+    """
+    Yield the entries of a Graph collection, following @odata.nextLink across pages.
+    
+    Pages are fetched lazily, so a caller that stops early (e.g. on the first
+    match) never requests the remaining pages. Callers that always read the
+    whole collection can pass prefetch=True: the next page is then requested
+    in the background as soon as its link is known, overlapping the download
+    with processing of the current page. Request the first page with
+    stream=True and pass stream=True here to let ijson, when installed, parse
+    entries as they arrive; follow-up pages are always streamed. Every
+    response is closed once iteration ends.
+    
+    Args:
+        resp: Successful response for the first page
+        headers: Request headers (authorization) to send with follow-up pages
+        prefetch: Fetch each follow-up page while the previous one is consumed
+        stream: The first page was requested with stream=True and its body is unread
+        
+    Raises:
+        requests.exceptions.HTTPError: If a follow-up page cannot be fetched
+    """
+    prefetched: Dict[str, Future] = {}
+    
+    def start_prefetch(link: str) -> None:
+        prefetched[link] = _PAGE_PREFETCHER.submit(_get_page, link, headers)
+    
+    try:
+        while resp is not None:
+            try:
+                next_link = yield from _iter_page_items(resp, stream, start_prefetch if prefetch else None)
+            finally:
+                resp.close()
+            
+            resp = None
+            if next_link:
+                future = prefetched.pop(next_link, None)
+                resp = future.result() if future is not None else _get_page(next_link, headers)
+                stream = True
+    finally:
+        # The caller stopped early: release any page fetched ahead
+        for future in prefetched.values():
+            future.add_done_callback(_close_prefetched_page)
+
+
+def iter_batch_items(body: Dict, headers: Dict, prefetch: bool = False) -> Iterator[Dict]:
+    """
+    Yield the entries of a collection returned as a $batch sub-response body.
+    
+    A batch carries only the first page; further pages are fetched from the
+    body's @odata.nextLink with iter_response_items.
+    
+    Raises:
+        requests.exceptions.HTTPError: If a follow-up page cannot be fetched
+    """
+    yield from body.get('value', [])
+    next_link = body.get('@odata.nextLink')
+    if next_link:
+        yield from iter_response_items(_get_page(next_link, headers), headers, prefetch, stream=True)
+
+
+def _post_batch_chunk(batch_url: str, headers: Dict, chunk: List[Dict]) -> Dict[str, Dict]:
+    """POST one chunk of at most BATCH_LIMIT sub-requests and key the responses by id."""
+    resp = SESSION.post(batch_url, headers=headers, data=dump_json({"requests": chunk}), timeout=REQUEST_TIMEOUT)
+
+    if resp.status_code != 200:
+        return {
+            subrequest['id']: {'status': resp.status_code, 'headers': dict(resp.headers), 'body': resp.text}
+            for subrequest in chunk
+        }
+
+    return {subresponse.get('id'): subresponse for subresponse in parse_json_response(resp).get('responses', [])}
+
+
+def _retry_after_seconds(subresponse: Dict, attempt: int) -> float:
+    """Read the Retry-After header (seconds) of a sub-response, else back off exponentially."""
+    for name, value in (subresponse.get('headers') or {}).items():
+        if name.lower() == 'retry-after':
+            try:
+                return max(float(value), 0.0)
+            except (TypeError, ValueError):
+                break
+    return DEFAULT_RETRY_AFTER * 2 ** attempt
+
+
+def _send_batch(batch_url: str, headers: Dict, subrequests: List[Dict]) -> Dict[str, Dict]:
+    """Send sub-requests in chunks of BATCH_LIMIT, concurrently when there are several."""
+    chunks = [subrequests[start:start + BATCH_LIMIT] for start in range(0, len(subrequests), BATCH_LIMIT)]
+    responses = {}
+
+    if len(chunks) <= 1:
+        for chunk in chunks:
+            responses.update(_post_batch_chunk(batch_url, headers, chunk))
+        return responses
+
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(chunks))) as executor:
+        for chunk_responses in executor.map(lambda chunk: _post_batch_chunk(batch_url, headers, chunk), chunks):
+            responses.update(chunk_responses)
+
+    return responses
+
+
+def graph_batch(access_token: str, subrequests: List[Dict],
+                retry_statuses: frozenset = BATCH_RETRY_STATUSES) -> Dict[str, Dict]:
+    """
+    Send sub-requests through the Microsoft Graph $batch endpoint.
+
+    Sub-requests are split into chunks of BATCH_LIMIT, so N sub-requests cost
+    ceil(N / 20) HTTP calls instead of N. Chunks are independent and are sent
+    concurrently, up to MAX_WORKERS at a time, over the pooled keep-alive
+    connections of SESSION. Batching is what multiplexes requests here: twenty
+    Graph calls share one HTTP/1.1 request, so there is no need for an HTTP/2
+    client on top of requests.
+
+    Graph throttles sub-requests individually, so a batch can succeed while
+    some of its entries come back 429 (or 503). Only those entries are
+    re-submitted, after waiting for the longest Retry-After among them plus up
+    to a second of jitter, so concurrent clients do not retry in lockstep.
+
+    Args:
+        access_token: OAuth access token
+        subrequests: Graph sub-requests, each with a unique 'id', a 'method' and
+                     a 'url' relative to the API version (e.g. "/me/drive/root")
+        retry_statuses: Sub-response statuses that are re-submitted. Pass {429}
+                        for writes that are unsafe to repeat after a 503
+
+    Returns:
+        Dict mapping each sub-request id to its response ('status', 'headers', 'body').
+        If a whole batch call fails, its sub-requests map to the batch status and text.
+    """
+    headers = {**auth_headers(access_token), "Content-Type": "application/json"}
+    batch_url = f"{GRAPH_BASE_URL}/$batch"
+    responses = _send_batch(batch_url, headers, subrequests)
+
+    for attempt in range(BATCH_THROTTLE_RETRIES):
+        throttled = [subrequest for subrequest in subrequests
+                     if responses.get(subrequest['id'], {}).get('status') in retry_statuses]
+        if not throttled:
+            break
+        delay = max(_retry_after_seconds(responses[subrequest['id']], attempt) for subrequest in throttled)
+        time.sleep(delay + random.uniform(0, 1))
+        responses.update(_send_batch(batch_url, headers, throttled))
+
+    return responses
@@ -0,0 +1,118 @@
+"""Tests for graph_batch: chunking, whole-batch failures and throttled re-submission."""
+
+import json
+import threading
+import unittest
+from unittest import mock
+
+import requests
+
+from src import graph_utils
+
+
+def make_response(status_code: int, body=None, text: str = "") -> requests.Response:
+    """Build a non-streamed requests.Response carrying a JSON body (or plain text)."""
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp._content = json.dumps(body).encode() if body is not None else text.encode()
+    return resp
+
+
+def subrequests(count: int):
+    return [{"id": str(i), "method": "GET", "url": f"/me/drive/items/{i}"} for i in range(count)]
+
+
+class FakeBatchEndpoint:
+    """Stands in for SESSION.post on /$batch, answering each sub-request via a callback."""
+
+    def __init__(self, answer=None, batch_status: int = 200):
+        self.answer = answer or (lambda subrequest, call: {'status': 200, 'body': {'id': subrequest['id']}})
+        self.batch_status = batch_status
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, url, headers=None, data=None, timeout=None):
+        chunk = json.loads(data)['requests']
+        with self._lock:
+            self.calls.append([subrequest['id'] for subrequest in chunk])
+            call = len(self.calls)
+        if self.batch_status != 200:
+            return make_response(self.batch_status, text="batch failed")
+        return make_response(200, {'responses': [
+            {'id': subrequest['id'], **self.answer(subrequest, call)} for subrequest in chunk
+        ]})
+
+
+class GraphBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sleep = mock.patch.object(graph_utils.time, 'sleep').start()
+        mock.patch.object(graph_utils.random, 'uniform', return_value=0.0).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def run_batch(self, endpoint, requests_, **kwargs):
+        with mock.patch.object(graph_utils.SESSION, 'post', side_effect=endpoint):
+            return graph_utils.graph_batch("token", requests_, **kwargs)
+
+    def test_splits_into_chunks_of_batch_limit(self):
+        endpoint = FakeBatchEndpoint()
+        responses = self.run_batch(endpoint, subrequests(45))
+
+        self.assertEqual(sorted(len(chunk) for chunk in endpoint.calls), [5, 20, 20])
+        self.assertEqual(sorted(sum(endpoint.calls, [])), sorted(str(i) for i in range(45)))
+        self.assertEqual(set(responses), {str(i) for i in range(45)})
+        self.assertTrue(all(response['status'] == 200 for response in responses.values()))
+        self.sleep.assert_not_called()
+
+    def test_whole_batch_failure_maps_onto_every_subrequest(self):
+        responses = self.run_batch(FakeBatchEndpoint(batch_status=500), subrequests(3))
+
+        self.assertEqual(set(responses), {'0', '1', '2'})
+        for response in responses.values():
+            self.assertEqual(response['status'], 500)
+            self.assertEqual(response['body'], "batch failed")
+
+    def test_resubmits_only_throttled_subrequests(self):
+        def answer(subrequest, call):
+            if call == 1 and subrequest['id'] == '1':
+                return {'status': 429, 'headers': {'Retry-After': '3'}, 'body': {}}
+            return {'status': 200, 'body': {'call': call}}
+        endpoint = FakeBatchEndpoint(answer)
+        responses = self.run_batch(endpoint, subrequests(3))
+
+        self.assertEqual(endpoint.calls, [['0', '1', '2'], ['1']])
+        self.assertEqual(responses['0']['body'], {'call': 1})
+        self.assertEqual(responses['1']['status'], 200)
+        self.assertEqual(responses['1']['body'], {'call': 2})
+        self.sleep.assert_called_once_with(3.0)
+
+    def test_waits_for_the_longest_retry_after(self):
+        def answer(subrequest, call):
+            if call == 1:
+                return {'status': 429, 'headers': {'retry-after': subrequest['id']}, 'body': {}}
+            return {'status': 200, 'body': {}}
+        self.run_batch(FakeBatchEndpoint(answer), subrequests(3))
+
+        self.sleep.assert_called_once_with(2.0)
+
+    def test_backs_off_exponentially_without_retry_after(self):
+        endpoint = FakeBatchEndpoint(lambda subrequest, call: {'status': 503, 'body': {}})
+        responses = self.run_batch(endpoint, subrequests(1))
+
+        self.assertEqual(len(endpoint.calls), 1 + graph_utils.BATCH_THROTTLE_RETRIES)
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list],
+                         [graph_utils.DEFAULT_RETRY_AFTER * 2 ** attempt
+                          for attempt in range(graph_utils.BATCH_THROTTLE_RETRIES)])
+        self.assertEqual(responses['0']['status'], 503)
+
+    def test_retry_statuses_limits_what_is_resubmitted(self):
+        endpoint = FakeBatchEndpoint(lambda subrequest, call: {'status': 503, 'body': {}})
+        responses = self.run_batch(endpoint, subrequests(2), retry_statuses=frozenset({429}))
+
+        self.assertEqual(len(endpoint.calls), 1)
+        self.assertEqual(responses['0']['status'], 503)
+        self.sleep.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+"""Tests for iterating paged Graph collections with iter_response_items."""
+
+import io
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from src import graph_utils
+from src.graph_utils import iter_response_items
+
+
+def page_body(items, next_link=None) -> bytes:
+    page = {'value': items}
+    if next_link:
+        page['@odata.nextLink'] = next_link
+    return json.dumps(page).encode()
+
+
+def streamed_response(body: bytes) -> requests.Response:
+    """A 200 response whose body is still unread, as returned for stream=True."""
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.raw = io.BytesIO(body)
+    return resp
+
+
+def read_response(body: bytes) -> requests.Response:
+    """A 200 response whose body has already been downloaded, as returned for stream=False."""
+    resp = requests.Response()
+    resp.status_code = 200
+    resp._content = body
+    return resp
+
+
+class IterResponseItemsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pages = {}
+        self.get = mock.patch.object(graph_utils.SESSION, 'get', side_effect=self.fake_get).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def fake_get(self, url, headers=None, timeout=None, stream=False):
+        return streamed_response(self.pages[url])
+
+    @unittest.skipIf(graph_utils.ijson is None, "ijson is not installed")
+    def test_streamed_page_is_parsed_incrementally(self):
+        body = page_body([{'id': 'a'}, {'id': 'b', 'roles': ['read']}])
+        with mock.patch.object(graph_utils, 'parse_json_response', wraps=graph_utils.parse_json_response) as parse:
+            items = list(iter_response_items(streamed_response(body), {}, stream=True))
+
+        self.assertEqual(items, [{'id': 'a'}, {'id': 'b', 'roles': ['read']}])
+        parse.assert_not_called()
+
+    def test_read_page_is_decoded_whole(self):
+        body = page_body([{'id': 'a'}, {'id': 'b'}])
+        with mock.patch.object(graph_utils, 'parse_json_response', wraps=graph_utils.parse_json_response) as parse:
+            items = list(iter_response_items(read_response(body), {}))
+
+        self.assertEqual(items, [{'id': 'a'}, {'id': 'b'}])
+        parse.assert_called_once()
+
+    def test_streamed_page_without_ijson_is_decoded_whole(self):
+        body = page_body([{'id': 'a'}])
+        with mock.patch.object(graph_utils, 'ijson', None):
+            items = list(iter_response_items(streamed_response(body), {}, stream=True))
+
+        self.assertEqual(items, [{'id': 'a'}])
+
+    def test_follows_next_links_lazily(self):
+        self.pages = {
+            'https://graph/page2': page_body([{'id': 'c'}], 'https://graph/page3'),
+            'https://graph/page3': page_body([{'id': 'd'}]),
+        }
+        first = read_response(page_body([{'id': 'a'}, {'id': 'b'}], 'https://graph/page2'))
+        items = iter_response_items(first, {'Authorization': 'Bearer token'})
+
+        self.assertEqual([next(items), next(items)], [{'id': 'a'}, {'id': 'b'}])
+        self.get.assert_not_called()
+
+        self.assertEqual(list(items), [{'id': 'c'}, {'id': 'd'}])
+        self.assertEqual([call.args[0] for call in self.get.call_args_list],
+                         ['https://graph/page2', 'https://graph/page3'])
+        self.assertEqual(self.get.call_args.kwargs['headers'], {'Authorization': 'Bearer token'})
+
+    def test_stopping_early_closes_the_page(self):
+        first = streamed_response(page_body([{'id': 'a'}, {'id': 'b'}], 'https://graph/page2'))
+        items = iter_response_items(first, {}, stream=True)
+        next(items)
+        items.close()
+
+        self.assertTrue(first.raw.closed)
+        self.get.assert_not_called()
+
+    def test_failed_follow_up_page_raises(self):
+        def fail(url, headers=None, timeout=None, stream=False):
+            resp = streamed_response(b'{}')
+            resp.status_code = 503
+            resp.url = url
+            return resp
+        self.get.side_effect = fail
+        items = iter_response_items(read_response(page_body([{'id': 'a'}], 'https://graph/page2')), {})
+
+        self.assertEqual(next(items), {'id': 'a'})
+        with self.assertRaises(requests.exceptions.HTTPError):
+            next(items)
+
+    def test_prefetch_requests_the_next_page_while_the_current_one_is_read(self):
+        self.pages = {'https://graph/page2': page_body([{'id': 'b'}])}
+        fetched = threading.Event()
+
+        def fetch(*args, **kwargs):
+            fetched.set()
+            return self.fake_get(*args, **kwargs)
+        self.get.side_effect = fetch
+        items = iter_response_items(read_response(page_body([{'id': 'a'}], 'https://graph/page2')), {},
+                                    prefetch=True)
+
+        self.assertEqual(next(items), {'id': 'a'})
+        self.assertTrue(fetched.wait(timeout=5))
+        self.assertEqual(list(items), [{'id': 'b'}])
+        self.assertEqual(self.get.call_count, 1)
+
+    def test_no_prefetch_by_default(self):
+        self.pages = {'https://graph/page2': page_body([{'id': 'b'}])}
+        items = iter_response_items(read_response(page_body([{'id': 'a'}], 'https://graph/page2')), {})
+
+        self.assertEqual(next(items), {'id': 'a'})
+        self.get.assert_not_called()
+
+    def test_stopping_early_closes_the_prefetched_page(self):
+        self.pages = {'https://graph/page2': page_body([{'id': 'b'}])}
+        prefetched = []
+
+        def fetch(*args, **kwargs):
+            prefetched.append(self.fake_get(*args, **kwargs))
+            return prefetched[-1]
+        self.get.side_effect = fetch
+        items = iter_response_items(read_response(page_body([{'id': 'a'}], 'https://graph/page2')), {},
+                                    prefetch=True)
+        next(items)
+        items.close()
+
+        deadline = time.monotonic() + 5
+        while not (prefetched and prefetched[0].raw.closed) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(prefetched and prefetched[0].raw.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+"""Tests for the clean-up of user-supplied item paths in acl_manager."""
+
+import io
+import unittest
+from contextlib import redirect_stdout
+
+from src.acl_manager import _normalize_item_paths
+
+
+def normalize(paths):
+    output = io.StringIO()
+    with redirect_stdout(output):
+        result = _normalize_item_paths(paths)
+    return result, output.getvalue()
+
+
+class NormalizeItemPathsTest(unittest.TestCase):
+
+    def test_strips_whitespace_and_slashes(self):
+        result, _ = normalize(["  /Documents/Project/ ", "Work"])
+        self.assertEqual(result, ["Documents/Project", "Work"])
+
+    def test_drops_duplicates_keeping_first_occurrence(self):
+        result, output = normalize(["B", "A", "/B/", "A"])
+        self.assertEqual(result, ["B", "A"])
+        self.assertIn("Skipping duplicate path: B", output)
+
+    def test_skips_empty_paths(self):
+        result, output = normalize(["", " / ", "A"])
+        self.assertEqual(result, ["A"])
+        self.assertEqual(output.count("Skipping empty path"), 2)
+
+    def test_skips_paths_graph_would_reject(self):
+        result, output = normalize(["A/../B", "..", "Notes:", "Tab\there", "Del\x7f", "Fine: yes"])
+        self.assertEqual(result, ["Fine: yes"])
+        self.assertEqual(output.count("Skipping invalid path"), 5)
+
+    def test_keeps_names_that_only_look_odd(self):
+        result, _ = normalize(["..hidden", "a..b", "Ünïcødé #1 100%"])
+        self.assertEqual(result, ["..hidden", "a..b", "Ünïcødé #1 100%"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""Tests for the client-side token bucket that paces Graph requests."""
+
+import json
+import unittest
+from unittest import mock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src import graph_utils
+from src.graph_utils import RateLimiter
+
+
+class FakeClock:
+    """Replaces time.monotonic and time.sleep in graph_utils; sleeping advances the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        mock.patch.object(graph_utils.time, 'monotonic', self.clock.monotonic).start()
+        mock.patch.object(graph_utils.time, 'sleep', self.clock.sleep).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_burst_is_free_then_paced_at_rate(self):
+        limiter = RateLimiter(rate=10.0, burst=3)
+        for _ in range(3):
+            limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+        limiter.acquire()
+        limiter.acquire()
+        self.assertEqual(len(self.clock.sleeps), 2)
+        self.assertAlmostEqual(self.clock.sleeps[0], 0.1)
+        self.assertAlmostEqual(self.clock.sleeps[1], 0.1)
+
+    def test_idle_time_refills_up_to_burst(self):
+        limiter = RateLimiter(rate=10.0, burst=2)
+        limiter.acquire()
+        limiter.acquire()
+        self.clock.now += 60
+        for _ in range(2):
+            limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+        limiter.acquire()
+        self.assertEqual(len(self.clock.sleeps), 1)
+
+    def test_overdrawn_acquires_queue_behind_each_other(self):
+        # Sleeps do not advance the clock here, as if both callers arrived at once: each
+        # overdrawn acquire reserves its token, so the second waits longer than the first
+        limiter = RateLimiter(rate=10.0, burst=1)
+        limiter.acquire()
+        with mock.patch.object(graph_utils.time, 'sleep') as sleep:
+            limiter.acquire()
+            limiter.acquire()
+        waits = [call.args[0] for call in sleep.call_args_list]
+        self.assertAlmostEqual(waits[0], 0.1)
+        self.assertAlmostEqual(waits[1], 0.2)
+
+    def test_zero_rate_disables_pacing(self):
+        limiter = RateLimiter(rate=0.0, burst=1)
+        for _ in range(100):
+            limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+        limiter.set_rate(5.0)
+        limiter.acquire()
+        limiter.acquire()
+        self.assertAlmostEqual(self.clock.sleeps[-1], 0.2)
+
+
+class BatchRateTest(unittest.TestCase):
+
+    def test_batch_call_takes_one_token(self):
+        def send(adapter, request, **kwargs):
+            resp = requests.Response()
+            resp.status_code = 200
+            resp.request = request
+            resp._content = json.dumps({'responses': [
+                {'id': subrequest['id'], 'status': 200, 'body': {}}
+                for subrequest in json.loads(request.body)['requests']
+            ]}).encode()
+            return resp
+
+        subrequests = [{"id": str(i), "method": "GET", "url": f"/me/drive/items/{i}"} for i in range(20)]
+        with mock.patch.object(HTTPAdapter, 'send', send), \
+                mock.patch.object(graph_utils.RATE_LIMITER, 'acquire') as acquire:
+            responses = graph_utils.graph_batch("token", subrequests)
+
+        self.assertEqual(len(responses), 20)
+        acquire.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+"""Tests for the level-by-level folder walk in scan_shared_folders_recursive."""
+
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import requests
+
+from src import acl_scanner
+
+
+def owner():
+    return {'id': 'owner', 'roles': ['owner'], 'grantedTo': {'user': {'email': 'me@example.com'}}}
+
+
+def grant(email, inherited_from=None):
+    perm = {'id': email, 'roles': ['write'], 'grantedTo': {'user': {'email': email, 'displayName': email}}}
+    if inherited_from:
+        perm['inheritedFrom'] = {'id': inherited_from}
+    return perm
+
+
+# id -> (name, parent id, has 'shared' facet, permissions)
+TREE = {
+    'R': ('root', None, False, [owner()]),
+    'A': ('Alpha', 'R', True, [owner(), grant('bob@example.com')]),
+    'A1': ('Alpha Sub', 'A', False, [owner(), grant('bob@example.com', 'A')]),
+    'A1x': ('Deep', 'A1', True, [owner(), grant('erin@example.com')]),
+    'B': ('Beta', 'R', True, [owner(), grant('carol@example.com')]),
+    'B1': ('Beta Sub', 'B', False, [owner(), grant('carol@example.com', 'B')]),
+    'C': ('Gamma', 'R', False, [owner()]),
+    'C1': ('Gamma Sub', 'C', True, [owner(), grant('dave@example.com')]),
+}
+
+
+class FakeFolderContents:
+    """Stands in for batch_get_folder_contents, recording what each call asked for."""
+
+    def __init__(self, unreadable=()):
+        self.unreadable = set(unreadable)
+        self.calls = []
+
+    def __call__(self, item_ids, folders, access_token):
+        self.calls.append((list(item_ids), [folder_id for folder_id, _ in folders]))
+        permissions = {item_id: None if item_id in self.unreadable else TREE[item_id][3] for item_id in item_ids}
+        subfolders = {
+            folder_id: [(child_id, f"{folder_path}/{name}" if folder_path else name, facet)
+                        for child_id, (name, parent, facet, _) in TREE.items() if parent == folder_id]
+            for folder_id, folder_path in folders
+        }
+        return permissions, subfolders
+
+    def requested_permissions(self):
+        return [item_id for item_ids, _ in self.calls for item_id in item_ids]
+
+    def listed(self):
+        return [folder_id for _, folder_ids in self.calls for folder_id in folder_ids]
+
+
+class ScanLevelsTest(unittest.TestCase):
+
+    def scan(self, contents, **kwargs):
+        root = requests.Response()
+        root.status_code = 200
+        root._content = json.dumps({'id': 'R'}).encode()
+        output = io.StringIO()
+        with mock.patch.object(acl_scanner, 'batch_get_folder_contents', contents), \
+                mock.patch.object(acl_scanner, 'refresh_access_token', side_effect=lambda token: token), \
+                mock.patch.object(acl_scanner.SESSION, 'get', return_value=root), \
+                redirect_stdout(output):
+            results = acl_scanner.scan_shared_folders_recursive("token", **kwargs)
+        return [folder['path'] for folder in results], output.getvalue()
+
+    def test_results_are_reported_in_tree_order(self):
+        paths, _ = self.scan(FakeFolderContents(), max_depth=0)
+        self.assertEqual(paths, ["Alpha", "Alpha/Alpha Sub", "Alpha/Alpha Sub/Deep",
+                                 "Beta", "Beta/Beta Sub", "Gamma/Gamma Sub"])
+
+    def test_each_level_is_requested_together(self):
+        contents = FakeFolderContents()
+        self.scan(contents, max_depth=0)
+
+        # The permissions of a level's folders share one call, whatever their parent
+        self.assertIn((['A', 'B'], ['A', 'B', 'C']), contents.calls)
+        self.assertIn(['A1', 'B1', 'C1'], [item_ids for item_ids, _ in contents.calls])
+
+    def test_unshared_folder_without_facet_needs_no_permissions_request(self):
+        contents = FakeFolderContents()
+        self.scan(contents, max_depth=0)
+
+        requested = contents.requested_permissions()
+        self.assertNotIn('C', requested)
+        # Inheriting from a shared parent still needs the request, facet or not
+        self.assertIn('A1', requested)
+        self.assertIn('C', contents.listed())
+
+    def test_max_depth_stops_checking_and_listing(self):
+        contents = FakeFolderContents()
+        paths, _ = self.scan(contents, max_depth=2)
+
+        self.assertEqual(paths, ["Alpha", "Beta"])
+        self.assertEqual(contents.listed(), ['R'])
+        self.assertNotIn('A1', contents.requested_permissions())
+
+    def test_only_user_prunes_below_an_explicit_grant(self):
+        contents = FakeFolderContents()
+        paths, output = self.scan(contents, max_depth=0, only_user="bob@example.com")
+
+        self.assertEqual(paths, ["Alpha"])
+        self.assertNotIn('A1', contents.requested_permissions())
+        self.assertNotIn('A', contents.listed())
+        self.assertIn("Pruning", output)
+
+    def test_unreadable_folder_is_reported_and_still_descended(self):
+        paths, output = self.scan(FakeFolderContents(unreadable={'B'}), max_depth=0)
+
+        self.assertNotIn("Beta", paths)
+        self.assertIn("Beta/Beta Sub", paths)
+        self.assertIn("1 folder(s) could not be read", output)
+        self.assertIn("   - Beta", output)
+
+
+if __name__ == "__main__":
+    unittest.main()